@@ -0,0 +1,175 @@
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# File layout: header | open-addressing slot table | blob of (key, gclid) byte strings
+MAGIC = b"GCLIDX2\0"
+HEADER = struct.Struct("<8sQQQ")  # magic, slot_count, entry_count, blob_offset
+SLOT = struct.Struct("<QIII")     # key hash (0 = empty), entry offset in blob, key length, gclid length
+
+def _key_hash(key):
+    value = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1
+
+def order_key(order_id):
+    return f"order:{order_id}"
+
+def session_key(session_id):
+    return f"session:{session_id}"
+
+def read_click_log(path):
+    """
+    Yield (key, gclid) pairs from a click-log export (CSV with header or JSONL) with
+    `gclid` and `order_id` and/or `session_id` columns.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        records = csv.DictReader(f) if path.endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            gclid = record.get("gclid")
+            if not gclid:
+                continue
+            if record.get("order_id"):
+                yield order_key(record["order_id"]), gclid
+            if record.get("session_id"):
+                yield session_key(record["session_id"]), gclid
+
+def build_index(export_path, index_path):
+    """
+    Build a memory-mappable gclid index from a click-log export. Later records win for duplicate keys.
+    The file is written next to index_path and renamed into place, so readers never see a partial index.
+    Returns the number of keys indexed.
+    """
+    entries = dict(read_click_log(export_path))
+    slot_count = 1
+    while slot_count < max(2 * len(entries), 8):
+        slot_count *= 2
+    mask = slot_count - 1
+
+    blob = bytearray()
+    table = bytearray(slot_count * SLOT.size)
+    for key, gclid in entries.items():
+        key_bytes, gclid_bytes = key.encode("utf-8"), gclid.encode("utf-8")
+        offset = len(blob)
+        blob += key_bytes + gclid_bytes
+        key_hash = _key_hash(key)
+        index = key_hash & mask
+        # Keys are unique here, so any occupied slot (even with an equal hash) belongs to another key
+        while SLOT.unpack_from(table, index * SLOT.size)[0] != 0:
+            index = (index + 1) & mask
+        SLOT.pack_into(table, index * SLOT.size, key_hash, offset, len(key_bytes), len(gclid_bytes))
+
+    blob_offset = HEADER.size + len(table)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(entries), blob_offset))
+        f.write(table)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+    logger.info("Built gclid index %s with %d keys in %d slots", index_path, len(entries), slot_count)
+    return len(entries)
+
+class GclidIndex:
+    """
+    Read-only, memory-mapped gclid lookup table with O(1) expected lookups (linear probing).
+    Slots match on the key hash and then on the stored key bytes, so colliding keys never share a gclid.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.entry_count, self._blob_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a gclid index: {path}")
+        self._mask = self.slot_count - 1
+
+    def __len__(self):
+        return self.entry_count
+
+    def get(self, key):
+        key_hash = _key_hash(key)
+        key_bytes = key.encode("utf-8")
+        index = key_hash & self._mask
+        while True:
+            slot_hash, offset, key_length, gclid_length = SLOT.unpack_from(self._mm, HEADER.size + index * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == key_hash and key_length == len(key_bytes):
+                start = self._blob_offset + offset
+                if self._mm[start:start + key_length] == key_bytes:
+                    return self._mm[start + key_length:start + key_length + gclid_length].decode("utf-8")
+            index = (index + 1) & self._mask
+
+    def lookup(self, order_id=None, session_id=None):
+        """
+        Return the gclid for an order, falling back to its session, or None.
+        """
+        gclid = self.get(order_key(order_id)) if order_id else None
+        if gclid is None and session_id:
+            gclid = self.get(session_key(session_id))
+        return gclid
+
+class ReloadingGclidIndex:
+    """
+    GclidIndex that a background thread reopens whenever the index file changes.
+    Lookups keep using the previous mapping until the new one is open, so reloads never block them.
+    """
+
+    def __init__(self, path, reload_seconds=300):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._index = GclidIndex(path)
+        self._mtime = os.stat(path).st_mtime_ns
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gclid-index-reloader", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, order_id=None, session_id=None):
+        return self._index.lookup(order_id=order_id, session_id=session_id)
+
+    def reload_if_changed(self):
+        """
+        Reopen the index file if its modification time changed. Returns True when a new index was loaded.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            self._index = GclidIndex(self.path)
+            self._mtime = mtime
+        except Exception as e:
+            logger.error("Failed to reload gclid index %s, keeping previous version: %s", self.path, e)
+            return False
+        logger.info("Reloaded gclid index %s with %d keys", self.path, len(self._index))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.reload_seconds):
+            self.reload_if_changed()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Build the gclid enrichment index from a click-log export")
+    parser.add_argument("export", help="Click-log export (.csv with header or .jsonl) with gclid, order_id and/or session_id")
+    parser.add_argument("index", help="Output index file")
+    args = parser.parse_args()
+
+    build_index(args.export, args.index)
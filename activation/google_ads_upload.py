@@ -1,12 +1,22 @@
-from google.cloud import bigquery
 import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
+from adaptive import AIMDController, is_throttle_error
+from bq.query import run_query
+from lazy_import import lazy_import
+from logging_setup import configure_logging, IntervalSummary
+
+bigquery = lazy_import("google.cloud.bigquery")
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Successful uploads are reported as one summary line per interval instead of one line per order
+upload_summary = IntervalSummary(logger, "Uploaded conversions")
+
 # Google Ads API mock placeholder
 def upload_conversion(conversion_payload):
     """
@@ -23,10 +33,10 @@ def upload_conversion(conversion_payload):
             raise ValueError("Negative conversion value")
         
         # Simulate upload
-        logger.info(f"Successfully uploaded conversion for order_id={conversion_payload['order_id']}")
+        upload_summary.add()
         return True
     except Exception as e:
-        logger.error(f"Failed to upload conversion for order_id={conversion_payload.get('order_id')}: {e}")
+        logger.error("Failed to upload conversion for order_id=%s: %s", conversion_payload.get('order_id'), e)
         return False
 
 # Config
@@ -34,6 +44,20 @@ PROJECT_ID = os.environ.get("PROJECT_ID", "pvh-gcp-project")
 DATASET = os.environ.get("DATASET", "analytics")
 ORDERS_TABLE = os.environ.get("ORDERS_TABLE", "orders")
 
+# Adaptive chunk size / parallelism bounds for batch_upload
+ADS_CHUNK_SIZE_INITIAL = int(os.environ.get("ADS_CHUNK_SIZE_INITIAL", "100"))
+ADS_CHUNK_SIZE_MIN = int(os.environ.get("ADS_CHUNK_SIZE_MIN", "10"))
+ADS_CHUNK_SIZE_MAX = int(os.environ.get("ADS_CHUNK_SIZE_MAX", "2000"))
+ADS_PARALLELISM_INITIAL = int(os.environ.get("ADS_PARALLELISM_INITIAL", "2"))
+ADS_PARALLELISM_MIN = int(os.environ.get("ADS_PARALLELISM_MIN", "1"))
+ADS_PARALLELISM_MAX = int(os.environ.get("ADS_PARALLELISM_MAX", "8"))
+ADS_LATENCY_TARGET_SECONDS = float(os.environ.get("ADS_LATENCY_TARGET_SECONDS", "5.0"))
+ADS_MAX_ERROR_RATE = float(os.environ.get("ADS_MAX_ERROR_RATE", "0.1"))
+
+# gclid enrichment index built from the click-log export (see activation/gclid_index.py)
+GCLID_INDEX_PATH = os.environ.get("GCLID_INDEX_PATH", "")
+GCLID_INDEX_RELOAD_SECONDS = float(os.environ.get("GCLID_INDEX_RELOAD_SECONDS", "300"))
+
 REQUIRED_FIELDS = [
     "gclid",
     "conversion_action",
@@ -49,7 +73,7 @@ def get_completed_orders():
     FROM `{PROJECT_ID}.{DATASET}.{ORDERS_TABLE}`
     WHERE status = 'COMPLETED'
     """
-    query_job = client.query(query)
+    query_job = run_query(client, query, label="completed_orders")
     return query_job.result()
 
 def prepare_conversion_payload(order):
@@ -78,14 +102,11 @@ def prepare_conversion_payload(order):
     }
     return payload
 
-def batch_upload(orders):
+def _validated_payloads(orders, stats, gclid_index=None):
     """
-    Upload conversions in batch.
+    Validate orders and yield their conversion payloads, counting skipped orders in stats.
+    Missing gclids are looked up in gclid_index by order_id, then session_id.
     """
-    success_count = 0
-    fail_count = 0
-    skipped_count = 0
-    dlq = []
     for order in orders:
         amount = getattr(order, "amount", None)
         event_ts = getattr(order, "event_ts", None)
@@ -94,36 +115,123 @@ def batch_upload(orders):
 
         # Validation before upload
         if amount is None or amount < 0:
-            logger.warning(f"Skipping order_id={getattr(order, 'order_id', 'UNKNOWN')} due to invalid amount: {amount}")
-            skipped_count += 1
-            dlq.append(order)
+            logger.warning("Skipping order_id=%s due to invalid amount: %s", getattr(order, 'order_id', 'UNKNOWN'), amount)
+            stats["skipped"] += 1
+            stats["dlq"].append(order)
             continue
         if event_ts is None or (not isinstance(event_ts, datetime) and not isinstance(event_ts, str)):
-            logger.warning(f"Skipping order_id={getattr(order, 'order_id', 'UNKNOWN')} due to missing or invalid event_ts: {event_ts}")
-            skipped_count += 1
-            dlq.append(order)
+            logger.warning("Skipping order_id=%s due to missing or invalid event_ts: %s", getattr(order, 'order_id', 'UNKNOWN'), event_ts)
+            stats["skipped"] += 1
+            stats["dlq"].append(order)
             continue
+        # Enrich missing gclid from the click-log index
+        if not gclid and gclid_index is not None:
+            gclid = gclid_index.lookup(order_id=getattr(order, "order_id", None), session_id=getattr(order, "session_id", None))
+            if gclid:
+                setattr(order, "gclid", gclid)
         # For missing gclid, assign default but log warning
         if not gclid:
-            logger.warning(f"Order_id={getattr(order, 'order_id', 'UNKNOWN')} missing gclid, assigning default value.")
+            logger.warning("Order_id=%s missing gclid, assigning default value.", getattr(order, 'order_id', 'UNKNOWN'))
             gclid = "TEST_GCLID"
             setattr(order, "gclid", gclid)
         # For invalid currency_code, assign default but log warning
         if currency_code not in ["USD", "EUR", "GBP"]:
-            logger.warning(f"Order_id={getattr(order, 'order_id', 'UNKNOWN')} has invalid currency_code: {currency_code}, assigning default 'USD'.")
+            logger.warning("Order_id=%s has invalid currency_code: %s, assigning default 'USD'.", getattr(order, 'order_id', 'UNKNOWN'), currency_code)
             currency_code = "USD"
             setattr(order, "currency_code", currency_code)
-        
-        payload = prepare_conversion_payload(order)
-        if upload_conversion(payload):
-            success_count += 1
+
+        yield prepare_conversion_payload(order)
+
+def upload_chunk(payloads):
+    """
+    Upload one chunk of conversion payloads. Returns (successes, failures, throttled, latency).
+    """
+    start = time.monotonic()
+    successes = failures = 0
+    throttled = False
+    for payload in payloads:
+        try:
+            ok = upload_conversion(payload)
+        except Exception as e:
+            logger.error("Failed to upload conversion for order_id=%s: %s", payload.get('order_id'), e)
+            throttled = throttled or is_throttle_error(e)
+            ok = False
+        if ok:
+            successes += 1
         else:
-            fail_count += 1
-    logger.info(f"Batch upload finished. Success: {success_count}, Failures: {fail_count}, Skipped: {skipped_count}")
+            failures += 1
+    return successes, failures, throttled, time.monotonic() - start
+
+def _next_chunk(payloads, size):
+    chunk = []
+    for payload in payloads:
+        chunk.append(payload)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+def batch_upload(orders, gclid_index=None):
+    """
+    Upload conversions in batch.
+    Orders without a gclid are enriched from gclid_index (an in-process GclidIndex) when given.
+    Payloads are uploaded in chunks on a thread pool; chunk size and the number of chunks in flight
+    are tuned by AIMD controllers from each chunk's latency, failure rate and throttling.
+    """
+    stats = {"success": 0, "fail": 0, "skipped": 0, "dlq": []}
+    chunk_size = AIMDController(
+        "ads_chunk_size",
+        initial=ADS_CHUNK_SIZE_INITIAL,
+        minimum=ADS_CHUNK_SIZE_MIN,
+        maximum=ADS_CHUNK_SIZE_MAX,
+        latency_target=ADS_LATENCY_TARGET_SECONDS,
+        increase_step=ADS_CHUNK_SIZE_MIN,
+        max_error_rate=ADS_MAX_ERROR_RATE,
+    )
+    parallelism = AIMDController(
+        "ads_parallelism",
+        initial=ADS_PARALLELISM_INITIAL,
+        minimum=ADS_PARALLELISM_MIN,
+        maximum=ADS_PARALLELISM_MAX,
+        latency_target=ADS_LATENCY_TARGET_SECONDS,
+        max_error_rate=ADS_MAX_ERROR_RATE,
+    )
+    payloads = _validated_payloads(orders, stats, gclid_index=gclid_index)
+    in_flight = set()
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=ADS_PARALLELISM_MAX) as executor:
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < parallelism.value:
+                chunk = _next_chunk(payloads, chunk_size.value)
+                if not chunk:
+                    exhausted = True
+                    break
+                in_flight.add(executor.submit(upload_chunk, chunk))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                successes, failures, throttled, latency = future.result()
+                stats["success"] += successes
+                stats["fail"] += failures
+                total = successes + failures
+                chunk_size.record(latency=latency, errors=failures, total=total, throttled=throttled)
+                parallelism.record(latency=latency, errors=failures, total=total, throttled=throttled)
+    upload_summary.flush()
+    logger.info("Batch upload finished. Success: %d, Failures: %d, Skipped: %d", stats['success'], stats['fail'], stats['skipped'])
+
+def load_gclid_index():
+    """
+    Open the gclid enrichment index configured by GCLID_INDEX_PATH, or return None.
+    """
+    if not GCLID_INDEX_PATH:
+        return None
+    from activation.gclid_index import ReloadingGclidIndex
+    return ReloadingGclidIndex(GCLID_INDEX_PATH, reload_seconds=GCLID_INDEX_RELOAD_SECONDS)
 
 def main():
+    gclid_index = load_gclid_index()
     completed_orders = get_completed_orders()
-    batch_upload(completed_orders)
+    batch_upload(completed_orders, gclid_index=gclid_index)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
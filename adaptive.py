@@ -0,0 +1,108 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_REASONS = ("rateLimitExceeded", "quotaExceeded", "RESOURCE_EXHAUSTED", "Too Many Requests")
+
+def is_throttle_error(error):
+    """
+    Best-effort detection of rate limiting from API exceptions or BigQuery insert error payloads.
+    """
+    if getattr(error, "code", None) == 429:
+        return True
+    return any(reason in str(error) for reason in THROTTLE_REASONS)
+
+# HTTP statuses of google.api_core server-side exceptions (InternalServerError, BadGateway, ServiceUnavailable, DeadlineExceeded)
+TRANSIENT_CODES = (500, 502, 503, 504)
+
+def is_transient_error(error):
+    """
+    True for throttling, transport and server-side failures, which more load makes worse. Data and
+    validation errors (bad JSON, invalid events, rejected rows) are not: they recur on every redelivery
+    whatever the load, so they must not shrink a controller.
+    """
+    if is_throttle_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "code", None) in TRANSIENT_CODES
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease controller for a batch size or concurrency level.
+
+    Each observation reports latency, error count and throttling. The value shrinks by
+    decrease_factor when throttled, when the error rate exceeds max_error_rate or when latency
+    exceeds latency_target; otherwise it grows by increase_step. The value always stays within
+    [minimum, maximum] and every adjustment is logged.
+    """
+
+    def __init__(self, name, initial, minimum, maximum, latency_target=None, increase_step=1,
+                 decrease_factor=0.5, max_error_rate=0.0):
+        if not minimum <= initial <= maximum:
+            raise ValueError(f"{name}: initial value {initial} outside bounds [{minimum}, {maximum}]")
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_error_rate = max_error_rate
+        self._value = initial
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def record(self, latency=None, errors=0, total=1, throttled=False):
+        """
+        Feed one observation into the controller and return the adjusted value.
+        """
+        error_rate = errors / total if total else 0.0
+        if throttled:
+            reason = "throttled"
+        elif error_rate > self.max_error_rate:
+            reason = f"error rate {error_rate:.2f}"
+        elif self.latency_target is not None and latency is not None and latency > self.latency_target:
+            reason = f"latency {latency:.3f}s over target {self.latency_target}s"
+        else:
+            reason = None
+
+        with self._lock:
+            old = self._value
+            if reason:
+                new = max(self.minimum, int(old * self.decrease_factor))
+            else:
+                new = min(self.maximum, old + self.increase_step)
+            self._value = new
+        if new != old:
+            logger.info("[%s] %s %d -> %d%s", self.name, "decrease" if reason else "increase", old, new, f" ({reason})" if reason else "")
+        return new
+
+class ConcurrencyLimiter:
+    """
+    Gate limiting how many callers run at once, with the limit taken from an AIMDController.
+    Callers report each call's outcome on release, which drives the controller; only transient
+    failures (see is_transient_error) should be reported as errors.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @property
+    def active(self):
+        return self._active
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self.controller.value:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self, latency=None, error=False, throttled=False):
+        self.controller.record(latency=latency, errors=int(error), throttled=throttled)
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from aggregation import etl
+from bq.query import run_query
+from lazy_import import lazy_import
+
+bigquery = lazy_import("google.cloud.bigquery")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get("BACKFILL_WORKERS", "4"))
+DEFAULT_CHECKPOINT_PATH = os.environ.get("BACKFILL_CHECKPOINT_PATH", ".backfill_checkpoint.json")
+
+def partition_dates(start_date: date, end_date: date):
+    """
+    Split an inclusive created_ts date range into daily partition-aligned chunks.
+    The orders table is partitioned by DATE(created_ts), so each chunk maps to exactly one partition.
+    """
+    if end_date < start_date:
+        raise ValueError(f"End date {end_date} is before start date {start_date}")
+    days = (end_date - start_date).days + 1
+    return [start_date + timedelta(days=offset) for offset in range(days)]
+
+def load_checkpoint(path, start_date: date, end_date: date):
+    """
+    Return the set of partition dates (ISO strings) already completed by a previous run of the same range.
+    A checkpoint written for a different range is ignored.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if (checkpoint.get("start"), checkpoint.get("end")) != (start_date.isoformat(), end_date.isoformat()):
+        logger.warning("Ignoring checkpoint %s for range %s -> %s", path, checkpoint.get("start"), checkpoint.get("end"))
+        return set()
+    return set(checkpoint.get("completed", []))
+
+def save_checkpoint(path, start_date: date, end_date: date, completed):
+    """
+    Atomically persist the completed partitions of a range so an interrupted backfill can resume.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"start": start_date.isoformat(), "end": end_date.isoformat(), "completed": sorted(completed)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def backfill_partition(client, partition_date: date):
+    """
+    Rebuild a single orders partition from the events created on that day.
+    The result replaces only that partition via the `$YYYYMMDD` decorator with WRITE_TRUNCATE.
+    """
+    destination = f"{etl.PROJECT_ID}.{etl.DATASET}.{etl.ORDERS_TABLE}${partition_date.strftime('%Y%m%d')}"
+    job_config = bigquery.QueryJobConfig(
+        destination=destination,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        query_parameters=[bigquery.ScalarQueryParameter("partition_date", "DATE", partition_date)],
+    )
+    query = etl.build_orders_select(partition_filter="DATE(created_ts) = @partition_date")
+    run_query(client, query, job_config=job_config, label=f"backfill_{partition_date.strftime('%Y%m%d')}")
+    logger.info("Backfilled partition %s into %s", partition_date.isoformat(), destination)
+
+def run_backfill(start_date: date, end_date: date, workers=DEFAULT_WORKERS, checkpoint_path=DEFAULT_CHECKPOINT_PATH, restart=False):
+    """
+    Backfill the orders table for a created_ts date range with bounded concurrency.
+    Finished partitions are checkpointed after each success; partitions already completed by an
+    interrupted run of the same range are skipped unless restart is set. The checkpoint is removed
+    once every partition has succeeded. Returns the list of partition dates that failed.
+    """
+    client = bigquery.Client(project=etl.PROJECT_ID)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    completed = load_checkpoint(checkpoint_path, start_date, end_date)
+    pending = [d for d in partition_dates(start_date, end_date) if d.isoformat() not in completed]
+    logger.info("Backfill %s -> %s: %d partitions pending, %d already done", start_date, end_date, len(pending), len(completed))
+
+    lock = threading.Lock()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(backfill_partition, client, d): d for d in pending}
+        for future in as_completed(futures):
+            partition_date = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error("Backfill failed for partition %s: %s", partition_date.isoformat(), e)
+                failed.append(partition_date)
+                continue
+            with lock:
+                completed.add(partition_date.isoformat())
+                save_checkpoint(checkpoint_path, start_date, end_date, completed)
+
+    logger.info("Backfill finished. Completed: %d, Failed: %d", len(pending) - len(failed), len(failed))
+    if not failed and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return sorted(failed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the consolidated orders table by created_ts partition")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First created_ts date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last created_ts date, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Maximum partitions rebuilt concurrently")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file used to resume interrupted runs")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and rebuild every partition of the range")
+    args = parser.parse_args()
+
+    failed = run_backfill(args.start, args.end, workers=args.workers, checkpoint_path=args.checkpoint, restart=args.restart)
+    if failed:
+        raise SystemExit(1)
@@ -14,8 +14,7 @@ WHERE
     AND status != ''
     AND amount IS NOT NULL
     AND amount >= 0
-    AND event_ts IS NOT NULL
-    AND SAFE.PARSE_TIMESTAMP('%d/%m/%Y %H:%M:%S', event_ts) IS NOT NULL
+    AND event_ts IS NOT NULL  -- native TIMESTAMP, no per-row parsing
     AND created_ts IS NOT NULL
 GROUP BY
     order_id;
\ No newline at end of file
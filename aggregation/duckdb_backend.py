@@ -0,0 +1,136 @@
+import argparse
+import os
+import time
+import logging
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+VALID_STATUSES = ["CREATED", "COMPLETED", "CANCELLED", "FAILED"]
+
+# Column types of order_events when read from JSONL, so missing keys become NULL. JSON has no timestamp
+# type, so timestamps are read as text and cast once in the classify step (a no-op for Parquet TIMESTAMP columns).
+JSON_COLUMNS = {
+    "order_id": "VARCHAR",
+    "status": "VARCHAR",
+    "amount": "DOUBLE",
+    "event_ts": "VARCHAR",
+    "created_ts": "VARCHAR",
+}
+
+def _events_relation(events_path):
+    """
+    Build the FROM clause reading local order_events files (Parquet or newline-delimited JSON, optionally gzipped).
+    Globs such as 'events/*.parquet' are supported.
+    """
+    path = events_path.replace("'", "''")
+    if events_path.endswith(".parquet"):
+        return f"read_parquet('{path}', union_by_name = true)"
+    columns = ", ".join(f"'{name}': '{column_type}'" for name, column_type in JSON_COLUMNS.items())
+    return f"read_json('{path}', format = 'newline_delimited', columns = {{{columns}}})"
+
+def _connect(threads=None):
+    con = duckdb.connect()
+    con.execute("SET TimeZone = 'UTC'")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    return con
+
+def build_classify_query(source):
+    """
+    Single scan of order_events: keep each row as an `event` struct, cast event_ts to TIMESTAMPTZ once and classify the row.
+    Unlike the BigQuery script the result stays one row per event: DuckDB reads the in-memory temp
+    table much faster than it re-parses the source files, and keeps the per-order aggregation cheap.
+    """
+    statuses = ", ".join(f"'{status}'" for status in VALID_STATUSES)
+    return f"""
+    SELECT
+        event,
+        parsed_event_ts,
+        event.amount IS NOT NULL AND event.amount >= 0
+        AND event.status IS NOT NULL AND event.status IN ({statuses})
+        AND parsed_event_ts IS NOT NULL AS is_valid
+    FROM (
+        SELECT e AS event, TRY_CAST(e.event_ts AS TIMESTAMPTZ) AS parsed_event_ts
+        FROM {source} e
+    )
+    """
+
+def run_consolidation(events_path, output_dir, threads=None):
+    """
+    Run the same DLQ and latest-state-per-order consolidation as etl.run_consolidation on DuckDB.
+    Reads local event files once into a classified temp table and writes `order_events_dlq.parquet`
+    and `orders.parquet` into output_dir from it. Returns a dict with row counts and per-step runtimes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    con = _connect(threads)
+    source = _events_relation(events_path)
+    dlq_path = os.path.join(output_dir, "order_events_dlq.parquet").replace("'", "''")
+    orders_path = os.path.join(output_dir, "orders.parquet").replace("'", "''")
+
+    logger.info("Classifying events in a single scan (duckdb)...")
+    start = time.monotonic()
+    con.execute(f"CREATE TEMP TABLE classified_events AS {build_classify_query(source)}")
+    classify_seconds = time.monotonic() - start
+    logger.info("Events classified in %.2fs", classify_seconds)
+
+    dlq_query = f"""
+    COPY (
+        SELECT
+            to_json(event) AS event,
+            'Validation failed' AS error,
+            current_timestamp::VARCHAR AS created_at
+        FROM classified_events
+        WHERE NOT is_valid
+    ) TO '{dlq_path}' (FORMAT PARQUET)
+    """
+    logger.info("Filtering invalid events into DLQ (duckdb)...")
+    start = time.monotonic()
+    dlq_rows = con.execute(dlq_query).fetchone()[0]
+    dlq_seconds = time.monotonic() - start
+    logger.info("Invalid events filtered into DLQ. Rows: %s in %.2fs", dlq_rows, dlq_seconds)
+
+    orders_query = f"""
+    COPY (
+        SELECT order_id, latest.*
+        FROM (
+            SELECT
+                event.order_id AS order_id,
+                arg_max({{
+                    'status': IFNULL(event.status, 'UNKNOWN'),
+                    'amount': event.amount,
+                    'event_ts': parsed_event_ts,
+                    'created_ts': IFNULL(TRY_CAST(event.created_ts AS TIMESTAMPTZ), current_timestamp)
+                }}, parsed_event_ts) AS latest  -- latest event per order
+            FROM classified_events
+            WHERE is_valid
+            GROUP BY event.order_id
+        )
+    ) TO '{orders_path}' (FORMAT PARQUET)
+    """
+    logger.info("Starting consolidation query for valid events (duckdb)...")
+    start = time.monotonic()
+    orders_rows = con.execute(orders_query).fetchone()[0]
+    orders_seconds = time.monotonic() - start
+    logger.info("Consolidation finished successfully. Rows: %s in %.2fs", orders_rows, orders_seconds)
+
+    con.close()
+    return {
+        "dlq_rows": dlq_rows,
+        "orders_rows": orders_rows,
+        "classify_seconds": round(classify_seconds, 3),
+        "dlq_seconds": round(dlq_seconds, 3),
+        "orders_seconds": round(orders_seconds, 3),
+    }
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Run the orders consolidation locally on DuckDB")
+    parser.add_argument("--events", required=True, help="Parquet or JSONL order_events file(s), globs allowed")
+    parser.add_argument("--output", required=True, help="Directory for orders.parquet and order_events_dlq.parquet")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB worker threads (default: all cores)")
+    args = parser.parse_args()
+
+    stats = run_consolidation(args.events, args.output, threads=args.threads)
+    logger.info("Local consolidation stats: %s", stats)
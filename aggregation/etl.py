@@ -1,11 +1,17 @@
-from google.cloud import bigquery
+import argparse
 import os
 import logging
 import json
+import time
 from datetime import datetime, timezone
+from bq.query import run_query, estimate_bytes
+from lazy_import import lazy_import
+from logging_setup import configure_logging
+
+bigquery = lazy_import("google.cloud.bigquery")
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Load config from environment or defaults
@@ -15,62 +21,172 @@ ORDER_EVENTS_TABLE = os.environ.get("ORDER_EVENTS_TABLE", "order_events")
 ORDERS_TABLE = os.environ.get("ORDERS_TABLE", "orders")
 DLQ_TABLE = os.environ.get("DLQ_TABLE", "order_events_dlq")
 
-VALID_STATUSES = ["CREATED", "COMPLETED", "CANCELLED", "FAILED"]
+# Consolidation backend: "bigquery" (default) or "duckdb" for local event files
+CONSOLIDATION_BACKEND = os.environ.get("CONSOLIDATION_BACKEND", "bigquery")
+LOCAL_EVENTS_PATH = os.environ.get("LOCAL_EVENTS_PATH", "data/order_events/*.parquet")
+LOCAL_OUTPUT_DIR = os.environ.get("LOCAL_OUTPUT_DIR", "data/consolidated")
 
-def run_consolidation():
-    client = bigquery.Client(project=PROJECT_ID)
+VALID_STATUSES = ["CREATED", "COMPLETED", "CANCELLED", "FAILED"]
 
-    # Insert invalid events into DLQ
-    dlq_query = f"""
-    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET}.{DLQ_TABLE}` AS
-    WITH invalid_events AS (
-        SELECT
-            TO_JSON_STRING(t) AS event,
-            'Validation failed' AS error,
-            CURRENT_TIMESTAMP() AS created_at
-        FROM `{PROJECT_ID}.{DATASET}.{ORDER_EVENTS_TABLE}` t
-        WHERE
-            amount IS NULL OR amount < 0
-            OR (status IS NULL OR status NOT IN UNNEST({VALID_STATUSES}))
-            OR SAFE.PARSE_TIMESTAMP('%Y-%m-%dT%H:%M:%S%Ez', event_ts) IS NULL
-            OR event_ts IS NULL OR event_ts = ''
-    )
-    SELECT * FROM invalid_events
+def build_orders_select(partition_filter=None):
     """
-    logger.info("Filtering invalid events into DLQ...")
-    dlq_job = client.query(dlq_query)
-    dlq_job.result()
-    logger.info(f"Invalid events filtered into DLQ. Rows affected: {dlq_job.num_dml_affected_rows}")
-
-    # Consolidate valid events into orders table with normalization
-    query = f"""
-    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET}.{ORDERS_TABLE}`
-    PARTITION BY DATE(TIMESTAMP(created_ts))
-    CLUSTER BY order_id
-    AS
+    Build the SELECT producing the latest valid event per order.
+    An optional partition_filter (SQL predicate) limits the scanned events, e.g. to one created_ts day;
+    event_ts and created_ts are native TIMESTAMP columns, so such filters prune order_events partitions.
+    """
+    extra_filter = f"AND {partition_filter}" if partition_filter else ""
+    return f"""
     SELECT
         order_id,
         ARRAY_AGG(STRUCT(
             IFNULL(status, 'UNKNOWN') AS status,
             amount,
             event_ts,
-            IF(created_ts IS NULL OR created_ts = '', FORMAT_TIMESTAMP('%Y-%m-%dT%H:%M:%S%Ez', CURRENT_TIMESTAMP()), created_ts) AS created_ts
+            IFNULL(created_ts, CURRENT_TIMESTAMP()) AS created_ts
         )
-        ORDER BY SAFE.PARSE_TIMESTAMP('%Y-%m-%dT%H:%M:%S%Ez', event_ts) DESC LIMIT 1)[OFFSET(0)].*  -- latest event per order
+        ORDER BY event_ts DESC LIMIT 1)[OFFSET(0)].*  -- latest event per order
     FROM
         `{PROJECT_ID}.{DATASET}.{ORDER_EVENTS_TABLE}`
     WHERE
         amount IS NOT NULL AND amount >= 0
         AND status IS NOT NULL AND status IN UNNEST({VALID_STATUSES})
-        AND SAFE.PARSE_TIMESTAMP('%Y-%m-%dT%H:%M:%S%Ez', event_ts) IS NOT NULL
-        AND event_ts IS NOT NULL AND event_ts != ''
+        AND event_ts IS NOT NULL
+        {extra_filter}
     GROUP BY
         order_id
     """
+
+def build_dlq_select():
+    """
+    Build the standalone SELECT of invalid events used by the former two-scan consolidation.
+    Kept for cost comparisons against the single-scan script.
+    """
+    return f"""
+    SELECT
+        TO_JSON_STRING(t) AS event,
+        'Validation failed' AS error,
+        CURRENT_TIMESTAMP() AS created_at
+    FROM `{PROJECT_ID}.{DATASET}.{ORDER_EVENTS_TABLE}` t
+    WHERE
+        amount IS NULL OR amount < 0
+        OR (status IS NULL OR status NOT IN UNNEST({VALID_STATUSES}))
+        OR event_ts IS NULL
+    """
+
+def build_classify_select():
+    """
+    Build the single scan of order_events: each row is classified once and rows are grouped by
+    order into the latest valid event and the JSON of every invalid event.
+    """
+    return f"""
+    WITH classified AS (
+        SELECT
+            t,
+            t.amount IS NOT NULL AND t.amount >= 0
+            AND t.status IS NOT NULL AND t.status IN UNNEST({VALID_STATUSES})
+            AND t.event_ts IS NOT NULL AS is_valid
+        FROM `{PROJECT_ID}.{DATASET}.{ORDER_EVENTS_TABLE}` t
+    )
+    SELECT
+        t.order_id,
+        ARRAY_AGG(IF(is_valid, STRUCT(
+            IFNULL(t.status, 'UNKNOWN') AS status,
+            t.amount AS amount,
+            t.event_ts AS event_ts,
+            IFNULL(t.created_ts, CURRENT_TIMESTAMP()) AS created_ts
+        ), NULL) IGNORE NULLS
+        ORDER BY t.event_ts DESC LIMIT 1)[SAFE_OFFSET(0)] AS latest,  -- latest valid event per order
+        ARRAY_AGG(IF(is_valid, NULL, TO_JSON_STRING(t)) IGNORE NULLS) AS invalid_events
+    FROM classified
+    GROUP BY t.order_id
+    """
+
+def build_consolidation_script():
+    """
+    Build the multi-statement script that scans order_events once into a per-order temp table
+    and writes both the DLQ and the orders table from it.
+    """
+    return f"""
+    CREATE TEMP TABLE consolidated_events AS
+    {build_classify_select()};
+
+    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET}.{DLQ_TABLE}` AS
+    SELECT
+        event,
+        'Validation failed' AS error,
+        CURRENT_TIMESTAMP() AS created_at
+    FROM consolidated_events, UNNEST(invalid_events) AS event;
+
+    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET}.{ORDERS_TABLE}`
+    PARTITION BY DATE(created_ts)
+    CLUSTER BY order_id
+    AS
+    SELECT order_id, latest.*
+    FROM consolidated_events
+    WHERE latest IS NOT NULL;
+    """
+
+def _run_plan(client, label, queries):
+    """
+    Run the SELECTs of one consolidation plan without the query cache and sum what BigQuery reports.
+    """
+    totals = {"bytes_processed": 0, "slot_millis": 0, "duration_s": 0.0}
+    for index, query in enumerate(queries):
+        start = time.monotonic()
+        job = run_query(client, query, job_config=bigquery.QueryJobConfig(use_query_cache=False), label=f"{label}_{index}")
+        totals["duration_s"] += time.monotonic() - start
+        totals["bytes_processed"] += job.total_bytes_processed or 0
+        totals["slot_millis"] += job.slot_millis or 0
+    totals["duration_s"] = round(totals["duration_s"], 3)
+    return totals
+
+def compare_scan_bytes(client, execute=False):
+    """
+    Compare the former two-scan consolidation with the single-scan classification over order_events.
+    Both are dry-run for the bytes they would scan; with execute=True their SELECTs are also run (no
+    query cache, results only in anonymous tables) to measure bytes processed, slot milliseconds and elapsed time.
+    Returns {"two_scan": {...}, "single_scan": {...}} with estimated_bytes and, when executed, the measurements.
+    Later statements of the script only read the per-order temp table, which is not known at dry-run time.
+    """
+    plans = {
+        "two_scan": [build_dlq_select(), build_orders_select()],
+        "single_scan": [build_classify_select()],
+    }
+    result = {}
+    for name, queries in plans.items():
+        result[name] = {"estimated_bytes": sum(estimate_bytes(client, query) for query in queries)}
+        logger.info("%s consolidation would scan %d bytes of %s", name, result[name]["estimated_bytes"], ORDER_EVENTS_TABLE)
+        if execute:
+            result[name].update(_run_plan(client, f"compare_{name}", queries))
+            logger.info("%s consolidation processed %d bytes in %.3fs using %d slot ms", name,
+                        result[name]["bytes_processed"], result[name]["duration_s"], result[name]["slot_millis"])
+    return result
+
+def run_consolidation():
+    if CONSOLIDATION_BACKEND == "duckdb":
+        from aggregation import duckdb_backend
+        return duckdb_backend.run_consolidation(LOCAL_EVENTS_PATH, LOCAL_OUTPUT_DIR)
+    if CONSOLIDATION_BACKEND != "bigquery":
+        raise ValueError(f"Unknown consolidation backend: {CONSOLIDATION_BACKEND}")
+
+    client = bigquery.Client(project=PROJECT_ID)
+
+    # Classify every event once and write invalid events to the DLQ and the latest valid
+    # state per order to the orders table from the same scan
+    # (bytes processed and runtime are logged by run_query under the "consolidation" label)
     logger.info("Starting consolidation query for valid events...")
-    query_job = client.query(query)
-    query_job.result()
+    # The script's later statements read its temp table, so a budget dry-run estimates the scan of order_events
+    query_job = run_query(client, build_consolidation_script(), label="consolidation", estimate_query=build_classify_select())
     logger.info(f"Consolidation finished successfully. Rows affected: {query_job.num_dml_affected_rows}")
+    return query_job
 
 if __name__ == "__main__":
-    run_consolidation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Consolidate order_events into the orders and DLQ tables")
+    parser.add_argument("--compare", action="store_true", help="Only dry-run and log bytes scanned by the two-scan and single-scan consolidations")
+    parser.add_argument("--execute", action="store_true", help="With --compare, also run both plans' SELECTs and log bytes, slot ms and runtime")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_scan_bytes(bigquery.Client(project=PROJECT_ID), execute=args.execute)
+    else:
+        run_consolidation()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+# Entry point -> module imported at startup
+ENTRY_POINTS = {
+    "main --mock": "main",
+    "consumer": "streaming.consumer",
+    "etl": "aggregation.etl",
+    "activation": "activation.google_ads_upload",
+}
+
+# SDKs that must only be imported by the code paths that use them
+HEAVY_MODULES = ("google.cloud.bigquery", "google.cloud.pubsub_v1", "google.ads", "pyarrow", "duckdb", "pandas")
+
+# A run regresses when it is slower than ratio * baseline by more than a few ms of noise
+REGRESSION_RATIO = 1.5
+REGRESSION_SLACK_MS = 5.0
+
+def measure_import_ms(module, runs=5):
+    """
+    Median cumulative import time (ms) of `module` in fresh interpreters, from `python -X importtime`.
+    """
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        )
+        for line in result.stderr.splitlines():
+            parts = [part.strip() for part in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                samples.append(int(parts[1]) / 1000.0)
+    return statistics.median(samples)
+
+def loaded_heavy_modules(module):
+    """
+    Return the heavy SDK modules loaded as a side effect of importing `module`.
+    """
+    code = f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return sorted(name for name in loaded if name.startswith(HEAVY_MODULES))
+
+def find_regressions(results, baseline):
+    """
+    Compare measured import times against the baseline. Returns a list of human readable regressions.
+    """
+    regressions = []
+    for name, elapsed_ms in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if elapsed_ms > reference * REGRESSION_RATIO + REGRESSION_SLACK_MS:
+            regressions.append(f"{name}: {elapsed_ms:.1f}ms (baseline {reference:.1f}ms)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the CLI entry points")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreter runs per entry point")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the measured times as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    for name, module in ENTRY_POINTS.items():
+        results[name] = round(measure_import_ms(module, runs=args.runs), 1)
+        heavy = loaded_heavy_modules(module)
+        print(f"{name:<12} {results[name]:>8.1f} ms")
+        if heavy:
+            failures.append(f"{name}: imports heavy SDKs at startup: {', '.join(heavy[:5])}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            failures.extend(find_regressions(results, json.load(f)))
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import json
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+import config
+from lazy_import import lazy_import
+
+bigquery = lazy_import("google.cloud.bigquery")
+
+logger = logging.getLogger(__name__)
+
+# Most recent query telemetry records, newest last
+QUERY_HISTORY = deque(maxlen=1000)
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised when a dry run estimates more bytes than the configured budget allows."""
+
+def _copy_config(job_config):
+    return bigquery.QueryJobConfig.from_api_repr(job_config.to_api_repr()) if job_config else bigquery.QueryJobConfig()
+
+def _dry_run_config(job_config):
+    dry_config = _copy_config(job_config)
+    dry_config.dry_run = True
+    dry_config.use_query_cache = False
+    return dry_config
+
+def estimate_bytes(client, query, job_config=None):
+    """
+    Dry-run a query and return the bytes it would process, without running it.
+    """
+    return client.query(query, job_config=_dry_run_config(job_config)).total_bytes_processed
+
+def _record(entry):
+    """
+    Keep the telemetry entry in memory and append it to the JSONL history file when configured.
+    """
+    QUERY_HISTORY.append(entry)
+    if config.QUERY_HISTORY_PATH:
+        with open(config.QUERY_HISTORY_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+def run_query(client, query, job_config=None, label="query", max_bytes=None, dry_run=None, estimate_query=None):
+    """
+    Run a BigQuery query with cost telemetry.
+
+    When a bytes budget is set (or dry_run is requested) the query is dry-run first and refused
+    with QueryBudgetExceeded if the estimate exceeds the budget; the budget is also enforced
+    server-side through maximum_bytes_billed on a copy of job_config. A multi-statement script whose
+    later statements read temp tables it creates cannot be dry-run as a whole: pass the statement
+    doing the expensive scan as estimate_query. Bytes processed, slot time and duration are logged
+    and recorded in QUERY_HISTORY. Returns the finished query job.
+    """
+    max_bytes = config.QUERY_MAX_BYTES_PROCESSED if max_bytes is None else max_bytes
+    if dry_run is None:
+        dry_run = config.QUERY_DRY_RUN or bool(max_bytes)
+
+    estimated_bytes = None
+    if dry_run:
+        estimated_bytes = estimate_bytes(client, estimate_query or query, job_config)
+        logger.info("[%s] Dry run estimate: %s bytes", label, estimated_bytes)
+        if max_bytes and estimated_bytes is not None and estimated_bytes > max_bytes:
+            _record({
+                "label": label,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "status": "REFUSED",
+                "estimated_bytes": estimated_bytes,
+                "max_bytes": max_bytes,
+            })
+            raise QueryBudgetExceeded(f"[{label}] Estimated {estimated_bytes} bytes exceeds budget of {max_bytes} bytes")
+
+    if max_bytes:
+        job_config = _copy_config(job_config)
+        job_config.maximum_bytes_billed = max_bytes
+
+    start = time.monotonic()
+    query_job = client.query(query, job_config=job_config) if job_config else client.query(query)
+    query_job.result()
+    duration = time.monotonic() - start
+
+    entry = {
+        "label": label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "status": "DONE",
+        "job_id": query_job.job_id,
+        "estimated_bytes": estimated_bytes,
+        "bytes_processed": query_job.total_bytes_processed,
+        "bytes_billed": query_job.total_bytes_billed,
+        "slot_millis": query_job.slot_millis,
+        "cache_hit": query_job.cache_hit,
+        "duration_s": round(duration, 3),
+    }
+    _record(entry)
+    logger.info(
+        "[%s] Query finished in %ss. Bytes processed: %s, Bytes billed: %s, Slot ms: %s",
+        label, entry["duration_s"], entry["bytes_processed"], entry["bytes_billed"], entry["slot_millis"],
+    )
+    return query_job
@@ -10,6 +10,49 @@ CONSOLIDATED_ORDERS_TABLE = os.getenv("CONSOLIDATED_ORDERS_TABLE", "orders")
 
 # Pub/Sub subscription
 PUBSUB_SUBSCRIPTION = os.getenv("PUBSUB_SUBSCRIPTION", "orders-subscription")
+# Topic receiving invalid events split out of batched envelopes; without it such envelopes are nacked whole
+PUBSUB_DLQ_TOPIC = os.getenv("PUBSUB_DLQ_TOPIC", "")
 
 # Google Ads settings
-GOOGLE_ADS_CONVERSION_ACTION = os.getenv("GOOGLE_ADS_CONVERSION_ACTION", "INSERT_CONVERSION_ACTION_ID_HERE")
\ No newline at end of file
+GOOGLE_ADS_CONVERSION_ACTION = os.getenv("GOOGLE_ADS_CONVERSION_ACTION", "INSERT_CONVERSION_ACTION_ID_HERE")
+
+# Query cost guard (a budget of 0 disables the bytes check)
+QUERY_MAX_BYTES_PROCESSED = int(os.getenv("QUERY_MAX_BYTES_PROCESSED", "0"))
+QUERY_DRY_RUN = os.getenv("QUERY_DRY_RUN", "false").lower() == "true"
+QUERY_HISTORY_PATH = os.getenv("QUERY_HISTORY_PATH", "")
+
+# Consumer sink: "streaming" (insert_rows_json per event), "batch" (adaptive insert_rows_json batches),
+# "write_api" (adaptive Arrow batches on a committed Storage Write API stream) or "file" (Parquet segments + batch loads)
+SINK_MODE = os.getenv("SINK_MODE", "streaming")
+FILE_SINK_STAGING_DIR = os.getenv("FILE_SINK_STAGING_DIR", "data/staging")
+FILE_SINK_LOAD_TARGET = os.getenv("FILE_SINK_LOAD_TARGET", "local")  # "local" or "bigquery"
+FILE_SINK_TARGET_DIR = os.getenv("FILE_SINK_TARGET_DIR", "data/order_events")
+# GCS prefix (gs://bucket/path) segments are staged under for the single load job per commit ("bigquery" target)
+FILE_SINK_GCS_URI = os.getenv("FILE_SINK_GCS_URI", "")
+FILE_SINK_MAX_ROWS = int(os.getenv("FILE_SINK_MAX_ROWS", "10000"))
+FILE_SINK_MAX_BYTES = int(os.getenv("FILE_SINK_MAX_BYTES", str(64 * 1024 * 1024)))
+FILE_SINK_MAX_AGE_SECONDS = float(os.getenv("FILE_SINK_MAX_AGE_SECONDS", "60"))
+FILE_SINK_COMMIT_INTERVAL_SECONDS = float(os.getenv("FILE_SINK_COMMIT_INTERVAL_SECONDS", "300"))
+
+# Adaptive batching / concurrency bounds for the consumer
+BQ_FLUSH_SIZE_INITIAL = int(os.getenv("BQ_FLUSH_SIZE_INITIAL", "100"))
+BQ_FLUSH_SIZE_MIN = int(os.getenv("BQ_FLUSH_SIZE_MIN", "10"))
+BQ_FLUSH_SIZE_MAX = int(os.getenv("BQ_FLUSH_SIZE_MAX", "5000"))
+BQ_FLUSH_LATENCY_TARGET_SECONDS = float(os.getenv("BQ_FLUSH_LATENCY_TARGET_SECONDS", "2.0"))
+BQ_FLUSH_MAX_WAIT_SECONDS = float(os.getenv("BQ_FLUSH_MAX_WAIT_SECONDS", "1.0"))
+CALLBACK_CONCURRENCY_INITIAL = int(os.getenv("CALLBACK_CONCURRENCY_INITIAL", "10"))
+CALLBACK_CONCURRENCY_MIN = int(os.getenv("CALLBACK_CONCURRENCY_MIN", "1"))
+CALLBACK_CONCURRENCY_MAX = int(os.getenv("CALLBACK_CONCURRENCY_MAX", "64"))
+CALLBACK_LATENCY_TARGET_SECONDS = float(os.getenv("CALLBACK_LATENCY_TARGET_SECONDS", "1.0"))
+
+# Checkpointed latest-state-per-order map for warm restarts (empty dir disables it). On start the consumer
+# can catch the checkpoint up with the latest order_events row per order (one scan of order_events)
+ORDER_STATE_DIR = os.getenv("ORDER_STATE_DIR", "")
+ORDER_STATE_CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("ORDER_STATE_CHECKPOINT_INTERVAL_SECONDS", "60"))
+ORDER_STATE_MAX_DELTAS = int(os.getenv("ORDER_STATE_MAX_DELTAS", "10"))
+ORDER_STATE_REBUILD_ON_START = os.getenv("ORDER_STATE_REBUILD_ON_START", "false").lower() == "true"
+
+# Logging: level, sampling of per-event INFO lines (1.0 = keep all) and success summary interval
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_SUMMARY_INTERVAL_SECONDS = float(os.getenv("LOG_SUMMARY_INTERVAL_SECONDS", "10"))
@@ -0,0 +1,29 @@
+import importlib
+import types
+
+class LazyModule(types.ModuleType):
+    """
+    Module placeholder that imports the real module on first attribute access.
+    Keeps heavy SDKs (google-cloud-*, google-ads) out of the import path of entry points that never use them.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self.__dict__["_module"] is None:
+            self.__dict__["_module"] = importlib.import_module(self.__name__)
+        return self.__dict__["_module"]
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name):
+    """
+    Return a LazyModule for `name`, e.g. `bigquery = lazy_import("google.cloud.bigquery")`.
+    """
+    return LazyModule(name)
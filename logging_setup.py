@@ -0,0 +1,103 @@
+import atexit
+import queue
+import time
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+import config
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_listener = None
+_lock = threading.Lock()
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched, so `%` formatting happens on the listener thread
+    instead of the logging call site. Only pass immutable or no-longer-modified objects as log args.
+    """
+
+    def prepare(self, record):
+        return record
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through one in every `every` records per message template below WARNING.
+    Warnings and errors always pass, so no error detail is lost. Templates must be %-style: an
+    f-string message is a new template per call. At most max_keys templates are counted; past
+    that the counters are reset, which only lets a few extra records through.
+    """
+
+    def __init__(self, every=1, max_keys=1024):
+        super().__init__()
+        self.every = max(1, int(every))
+        self.max_keys = max_keys
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count == 0 and len(self._counts) >= self.max_keys:
+                self._counts.clear()
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+def configure_logging(level=None):
+    """
+    Route the root logger through a background QueueListener (replaces logging.basicConfig).
+    Like basicConfig it does nothing when the root logger already has handlers.
+    """
+    global _listener
+    with _lock:
+        root = logging.getLogger()
+        if _listener is not None or root.handlers:
+            return
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.SimpleQueue()
+        queue_handler = LazyQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(every=round(1 / config.LOG_SAMPLE_RATE) if config.LOG_SAMPLE_RATE > 0 else 1))
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        root.addHandler(queue_handler)
+        root.setLevel(level or config.LOG_LEVEL)
+
+class IntervalSummary:
+    """
+    Aggregates per-event successes into one INFO line per interval, replacing per-row success logs.
+    Counts are flushed when the interval has elapsed at the next add(), and at interpreter exit.
+    """
+
+    def __init__(self, logger, description, interval_seconds=None):
+        self.logger = logger
+        self.description = description
+        self.interval_seconds = config.LOG_SUMMARY_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        self._count = 0
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def add(self, count=1):
+        with self._lock:
+            self._count += count
+            if time.monotonic() - self._started_at < self.interval_seconds:
+                return
+            count, elapsed = self._reset_locked()
+        self.logger.info("%s: %d in last %.1fs", self.description, count, elapsed)
+
+    def flush(self):
+        with self._lock:
+            count, elapsed = self._reset_locked()
+        if count:
+            self.logger.info("%s: %d in last %.1fs", self.description, count, elapsed)
+
+    def _reset_locked(self):
+        now = time.monotonic()
+        count, elapsed = self._count, now - self._started_at
+        self._count, self._started_at = 0, now
+        return count, elapsed
@@ -1,13 +1,22 @@
 import argparse
 import random
+import threading
+from itertools import islice
 from datetime import datetime, timezone, timedelta
 from tabulate import tabulate
 from colorama import Fore, Style, init
 from streaming import transformer
 from activation import google_ads_upload as ga
+from pipeline import StagedPipeline, Stage
+from streaming.order_state import OrderStateStore
 
 init(autoreset=True)
 
+# Table displays show at most this many rows
+MAX_TABLE_ROWS = 20
+# An order in one of these statuses receives no further events, so it can be uploaded right away
+TERMINAL_STATUSES = {"COMPLETED", "CANCELLED", "FAILED"}
+
 def is_valid_event(event):
     # Check amount is not None and >= 0
     amount = event.get("amount")
@@ -111,77 +120,137 @@ class DummyOrder:
         self.event_ts = order_dict.get("event_ts")
         self.created_ts = order_dict.get("created_ts")
 
-def run_mock(num_events=10, fail_rate=0.1, show_timeline=False, show_status_metrics=False):
+def validate_and_transform(event):
+    """
+    Validate and transform one mock event. Returns a dict with the event and either its transformed row or a DLQ error.
+    """
+    if not is_valid_event(event):
+        return {"event": event, "error": "Validation failed"}
+    try:
+        transformed = transformer.transform_order_event(event)
+        if transformed.get("dlq", False):
+            return {"event": event, "error": "Transformer flagged DLQ"}
+        return {"event": event, "row": transformed}
+    except Exception as e:
+        return {"event": event, "error": str(e)}
+
+def upload_order(order_dict):
+    """
+    Mock Google Ads upload of an aggregated order. Returns (order_id, success), success is None when not uploaded.
+    """
+    if order_dict["status"] != "COMPLETED":
+        return order_dict["order_id"], None  # Not uploaded
+    payload = ga.prepare_conversion_payload(DummyOrder(order_dict))
+    return order_dict["order_id"], ga.upload_conversion(payload)
+
+def run_mock(num_events=10, fail_rate=0.1, show_timeline=False, show_status_metrics=False,
+             workers=1, queue_size=100, show_pipeline_stats=False, state_dir=None):
     print("Running in mock mode with PVH-style events...\n")
     mock_events = generate_mock_events(num_events, fail_rate)
 
-    transformed_rows = []
-    dlq_events = []
-
-    print("--- Transformation Step ---")
-    for event in mock_events[:num_events]:
-        if not is_valid_event(event):
-            dlq_events.append({"event": event, "error": "Validation failed"})
-            print(Fore.RED + f"DLQ Event: {event.get('id', 'UNKNOWN')} | Error: Validation failed")
-            continue
-        try:
-            transformed = transformer.transform_order_event(event)
-            if transformed.get("dlq", False):
-                dlq_events.append({"event": event, "error": "Transformer flagged DLQ"})
-                print(Fore.RED + f"DLQ Event: {event.get('id', 'UNKNOWN')} | Error: Transformer flagged DLQ")
-                continue
-            # Ensure created_ts is set to UNKNOWN_TIMESTAMP if missing or invalid
-            created_ts_str = event.get("created_at")
-            try:
-                datetime.strptime(created_ts_str, "%d/%m/%Y %H:%M:%S")
-                transformed["created_ts"] = created_ts_str
-            except Exception:
-                transformed["created_ts"] = "UNKNOWN_TIMESTAMP"
-            transformed_rows.append(transformed)
-            print(Fore.GREEN + f"Transformed: {transformed['order_id']}")
-        except Exception as e:
-            dlq_events.append({"event": event, "error": str(e)})
-            print(Fore.RED + f"DLQ Event: {event['id'] if 'id' in event else 'UNKNOWN'} | Error: {e}")
-
-    print("\n--- Aggregation Step ---")
-    # Aggregate latest status per order, exclude DLQ events
+    # Tables keep at most MAX_TABLE_ROWS rows; counters cover every event
+    transformed_sample = []
+    dlq_sample = []
+    counts = {"transformed": 0, "dlq": 0}
+    status_counts = {}
+    dlq_order_ids = set()
     orders = {}
-    dlq_order_ids = {dlq_entry["event"].get("id") for dlq_entry in dlq_events}
-    for row in transformed_rows:
+    # Orders whose latest row changed in this run; restored orders were uploaded by an earlier run
+    changed_order_ids = set()
+    emitted_order_ids = set()
+    # Per-order stage outcomes are only kept for the timeline
+    transformed_ids = set() if show_timeline else None
+    upload_results = {} if show_timeline else None
+    upload_counts = {True: 0, False: 0, None: 0}
+    # The aggregate stage and upload results print from different threads
+    print_lock = threading.Lock()
+
+    # Warm start: seed the per-order state from the last checkpoint
+    state = OrderStateStore(state_dir) if state_dir else None
+    if state is not None:
+        state.load()
+        orders.update({order_id: state.get(order_id) for order_id in state})
+        print(f"Restored state of {len(orders)} orders from {state_dir}\n")
+
+    def aggregate(result):
+        # Single worker: keeps the latest row per order and emits an order to upload as soon as it is terminal
+        event = result["event"]
+        if "error" in result:
+            counts["dlq"] += 1
+            dlq_order_ids.add(event.get("id"))
+            if len(dlq_sample) < MAX_TABLE_ROWS:
+                dlq_sample.append(result)
+            with print_lock:
+                print(Fore.RED + f"DLQ Event: {event.get('id', 'UNKNOWN')} | Error: {result['error']}")
+            return None
+        row = result["row"]
+        counts["transformed"] += 1
+        status = row.get("status") or "UNKNOWN"
+        status_counts[status] = status_counts.get(status, 0) + 1
+        if len(transformed_sample) < MAX_TABLE_ROWS:
+            transformed_sample.append(row)
+        if transformed_ids is not None:
+            transformed_ids.add(row["order_id"])
+        with print_lock:
+            print(Fore.GREEN + f"Transformed: {row['order_id']}")
         order_id = row["order_id"]
-        if order_id in dlq_order_ids:
-            continue
         if order_id not in orders or row["event_ts"] > orders[order_id]["event_ts"]:
             orders[order_id] = row
+            changed_order_ids.add(order_id)
+        latest = orders[order_id]
+        if (latest["status"] in TERMINAL_STATUSES and order_id in changed_order_ids
+                and order_id not in dlq_order_ids and order_id not in emitted_order_ids):
+            emitted_order_ids.add(order_id)
+            return latest
+        return None
+
+    def emit_orders():
+        # Exclude orders with DLQ events from the state (one already emitted before its DLQ event stays uploaded)
+        for order_id in [order_id for order_id in orders if order_id in dlq_order_ids]:
+            del orders[order_id]
+            if state is not None:
+                state.delete(order_id)
+        changed = [row for order_id, row in orders.items() if order_id in changed_order_ids]
+        if state is not None:
+            for row in changed:
+                state.apply(row)
+            state.checkpoint()
+        # Orders still open at end of input go to the upload stage too, which does not upload them
+        return [row for row in changed if row["order_id"] not in emitted_order_ids]
+
+    def record_upload(result):
+        order_id, success = result
+        upload_counts[success] += 1
+        if upload_results is not None:
+            upload_results[order_id] = success
+        if success is not None:
+            status_str = Fore.GREEN + "SUCCESS" if success else Fore.RED + "FAILED"
+            with print_lock:
+                print(f"Order {order_id} -> Google Ads Upload: {status_str}")
+
+    pipeline = StagedPipeline([
+        Stage("transform", validate_and_transform, workers=workers, queue_size=queue_size),
+        Stage("aggregate", aggregate, workers=1, queue_size=queue_size, on_finish=emit_orders),
+        Stage("upload", upload_order, workers=workers, queue_size=queue_size),
+    ])
+
+    print("--- Transformation, Aggregation and Google Ads Upload ---")
+    pipeline.run(iter(mock_events[:num_events]), on_result=record_upload)
 
     # Display transformed events table
-    if transformed_rows:
-        print("\n--- Transformed Events Table ---")
-        print(tabulate(transformed_rows, headers="keys", tablefmt="grid"))
+    if transformed_sample:
+        print(f"\n--- Transformed Events Table (first {len(transformed_sample)} of {counts['transformed']}) ---")
+        print(tabulate(transformed_sample, headers="keys", tablefmt="grid"))
 
     # Display aggregated orders table
     if orders:
-        print("\n--- Aggregated Orders Table ---")
-        print(tabulate(orders.values(), headers="keys", tablefmt="grid"))
+        print(f"\n--- Aggregated Orders Table (first {min(len(orders), MAX_TABLE_ROWS)} of {len(orders)}) ---")
+        print(tabulate(list(islice(orders.values(), MAX_TABLE_ROWS)), headers="keys", tablefmt="grid"))
 
     # Display DLQ table
-    if dlq_events:
-        print("\n--- Dead Letter Queue Table ---")
-        print(tabulate(dlq_events, headers="keys", tablefmt="grid"))
-
-    # Mock Google Ads upload
-    print("\n--- Google Ads Upload Step ---")
-    upload_results = {}
-    for order_dict in orders.values():
-        if order_dict["status"] == "COMPLETED":
-            order_obj = DummyOrder(order_dict)
-            payload = ga.prepare_conversion_payload(order_obj)
-            success = ga.upload_conversion(payload)
-            upload_results[order_dict["order_id"]] = success
-            status_str = Fore.GREEN + "SUCCESS" if success else Fore.RED + "FAILED"
-            print(f"Order {order_obj.order_id} -> Google Ads Upload: {status_str}")
-        else:
-            upload_results[order_dict["order_id"]] = None  # Not uploaded
+    if dlq_sample:
+        print(f"\n--- Dead Letter Queue Table (first {len(dlq_sample)} of {counts['dlq']}) ---")
+        print(tabulate(dlq_sample, headers="keys", tablefmt="grid"))
 
     # Timeline visualization
     if show_timeline:
@@ -201,12 +270,11 @@ def run_mock(num_events=10, fail_rate=0.1, show_timeline=False, show_status_metr
             ga_stage = Fore.RED + "✘" + Style.RESET_ALL
 
             # Check transformed
-            transformed_entry = next((t for t in transformed_rows if t["order_id"] == order_id), None)
-            if transformed_entry:
+            if order_id in transformed_ids:
                 transformed_stage = Fore.GREEN + "✔" + Style.RESET_ALL
             else:
                 # Check if in DLQ
-                if any(dlq.get("event", {}).get("id") == order_id for dlq in dlq_events):
+                if order_id in dlq_order_ids:
                     transformed_stage = Fore.RED + "✘" + Style.RESET_ALL
                 else:
                     transformed_stage = Fore.RED + "✘" + Style.RESET_ALL
@@ -236,22 +304,22 @@ def run_mock(num_events=10, fail_rate=0.1, show_timeline=False, show_status_metr
     # Enhanced Metrics Summary
     print("\n--- Metrics Summary ---")
     print(f"Total Events Processed: {len(mock_events[:num_events])}")
-    print(f"Transformed Events: {len(transformed_rows)}")
+    print(f"Transformed Events: {counts['transformed']}")
     print(f"Aggregated Orders: {len(orders)}")
-    print(f"DLQ Events: {len(dlq_events)}")
-    print(f"Google Ads Uploads: {sum(1 for v in upload_results.values() if v is True)}")
-    print(f"Google Ads Upload Failures: {sum(1 for v in upload_results.values() if v is False)}")
-    print(f"Orders Aggregated but Not Uploaded: {sum(1 for v in upload_results.values() if v is None)}")
+    print(f"DLQ Events: {counts['dlq']}")
+    print(f"Google Ads Uploads: {upload_counts[True]}")
+    print(f"Google Ads Upload Failures: {upload_counts[False]}")
+    print(f"Orders Aggregated but Not Uploaded: {upload_counts[None]}")
 
     if show_status_metrics:
         print("\n--- Per-Status Counts ---")
-        status_counts = {}
-        for event in transformed_rows:
-            status = event.get("status") or "UNKNOWN"
-            status_counts[status] = status_counts.get(status, 0) + 1
         status_table = [[status, count] for status, count in sorted(status_counts.items())]
         print(tabulate(status_table, headers=["Status", "Count"], tablefmt="grid"))
 
+    if show_pipeline_stats:
+        print("\n--- Pipeline Stage Stats ---")
+        print(tabulate(pipeline.report(), headers="keys", tablefmt="grid"))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="RCA Streaming Consumer")
     parser.add_argument("--mock", action="store_true", help="Run in mock mode with local events")
@@ -259,10 +327,16 @@ if __name__ == "__main__":
     parser.add_argument("--fail-rate", type=float, default=0.1, help="Simulated failure rate for mock events")
     parser.add_argument("--timeline", action="store_true", help="Display order processing timeline")
     parser.add_argument("--status-metrics", action="store_true", help="Display per-status counts in metrics summary")
+    parser.add_argument("--workers", type=int, default=1, help="Worker threads for the transform and upload stages")
+    parser.add_argument("--queue-size", type=int, default=100, help="Bounded queue size between pipeline stages")
+    parser.add_argument("--pipeline-stats", action="store_true", help="Display per-stage throughput and queue occupancy")
+    parser.add_argument("--state-dir", default=None, help="Checkpoint the per-order state here and restore it on the next run")
     args = parser.parse_args()
 
     if args.mock:
-        run_mock(num_events=args.events, fail_rate=args.fail_rate, show_timeline=args.timeline, show_status_metrics=args.status_metrics)
+        run_mock(num_events=args.events, fail_rate=args.fail_rate, show_timeline=args.timeline, show_status_metrics=args.status_metrics,
+                 workers=args.workers, queue_size=args.queue_size, show_pipeline_stats=args.pipeline_stats,
+                 state_dir=args.state_dir)
     else:
         from streaming.consumer import start_consumer
         try:
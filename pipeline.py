@@ -0,0 +1,209 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+class PipelineStopped(Exception):
+    """Raised inside pipeline threads once another stage has failed."""
+
+class Stage:
+    """
+    One step of a StagedPipeline.
+
+    fn(item) is called for every input item by `workers` threads. It returns the output item,
+    None to drop the item, or (with fan_out=True) an iterable of output items. on_finish(), if
+    given, runs once after the stage has seen its whole input and returns an iterable of extra
+    output items, which lets barrier stages such as aggregations emit their state.
+    queue_size bounds the stage's input queue, so a slow stage applies backpressure upstream.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=100, fan_out=False, on_finish=None):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.fan_out = fan_out
+        self.on_finish = on_finish
+
+class StageStats:
+    """
+    Throughput and input queue occupancy counters for one stage.
+    """
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+        self._lock = threading.Lock()
+
+    def sample_queue(self, depth):
+        with self._lock:
+            self.queue_samples += 1
+            self.queue_total += depth
+            self.queue_max = max(self.queue_max, depth)
+
+    def record(self, outputs, busy):
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            self.items_in += 1
+            self.items_out += outputs
+            self.busy_seconds += busy
+
+    def add_outputs(self, count=1):
+        with self._lock:
+            self.items_out += count
+
+    def as_dict(self):
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "items_per_sec": round(self.items_in / elapsed, 1) if elapsed > 0 else None,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "queue_avg": round(self.queue_total / self.queue_samples, 1) if self.queue_samples else 0,
+            "queue_max": self.queue_max,
+            "queue_size": self.queue_size,
+        }
+
+class StagedPipeline:
+    """
+    Runs items through stages connected by bounded queues, each stage with its own worker threads.
+    Stages overlap: a stage starts processing as soon as its first input arrives. If any stage
+    raises, the pipeline stops and run() re-raises the first error.
+    """
+
+    def __init__(self, stages, output_queue_size=100):
+        self.stages = stages
+        self.output_queue_size = output_queue_size
+        self.stats = [StageStats(stage.name, stage.workers, stage.queue_size) for stage in stages]
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _feed(self, source, q, workers):
+        try:
+            for item in source:
+                self._put(q, item)
+            for _ in range(workers):
+                self._put(q, _END)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            self._fail(e)
+
+    def _work(self, stage, stats, in_q, out_q, next_workers, remaining):
+        try:
+            while True:
+                stats.sample_queue(in_q.qsize())
+                item = self._get(in_q)
+                if item is _END:
+                    break
+                start = time.monotonic()
+                result = stage.fn(item)
+                outputs = [] if result is None else (list(result) if stage.fan_out else [result])
+                stats.record(len(outputs), time.monotonic() - start)
+                for output in outputs:
+                    self._put(out_q, output)
+            with remaining["lock"]:
+                remaining["count"] -= 1
+                last = remaining["count"] == 0
+            if last:
+                # The last worker of the stage flushes barrier state and closes the next queue
+                if stage.on_finish is not None:
+                    for output in stage.on_finish() or []:
+                        stats.add_outputs()
+                        self._put(out_q, output)
+                stats.finished_at = time.monotonic()
+                for _ in range(next_workers):
+                    self._put(out_q, _END)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            logger.error("Stage %s failed: %s", stage.name, e)
+            self._fail(e)
+
+    def run(self, source, on_result=None):
+        """
+        Feed `source` through the stages and return the list of items produced by the last stage.
+        With on_result, each item is passed to it as it arrives instead of being collected (run() returns []).
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(maxsize=self.output_queue_size))
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0], self.stages[0].workers), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            remaining = {"count": stage.workers, "lock": threading.Lock()}
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, self.stats[index], queues[index], queues[index + 1], next_workers, remaining),
+                    name=f"{stage.name}-{worker}",
+                    daemon=True,
+                ))
+        for thread in threads:
+            thread.start()
+
+        results = []
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                if on_result is None:
+                    results.append(item)
+                else:
+                    on_result(item)
+        except PipelineStopped:
+            pass
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
+        return results
+
+    def report(self):
+        """
+        Per-stage throughput and queue occupancy, one dict per stage.
+        """
+        return [stats.as_dict() for stats in self.stats]
@@ -0,0 +1,112 @@
+import time
+import logging
+import threading
+from adaptive import is_throttle_error
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveBatchSink:
+    """
+    Buffers transformed rows and flushes them to BigQuery with one insert call per batch.
+    The flush size comes from an AIMDController fed with each flush's latency, row error rate and
+    throttling, so batches grow while BigQuery keeps up and shrink when it slows down or rejects rows.
+    Messages are acked after their row is inserted and nacked if it is rejected. Rejected rows are
+    counted in failed_rows, so callers appending rows without a message (replays) can detect the loss.
+
+    insert_rows(rows) must return the insert_rows_json error list ([] on success).
+    """
+
+    def __init__(self, insert_rows, controller, max_wait_seconds=1.0):
+        self.insert_rows = insert_rows
+        self.controller = controller
+        self.max_wait_seconds = max_wait_seconds
+        self._rows = []
+        self._messages = []
+        self._opened_at = None
+        self.failed_rows = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = None
+
+    def append(self, row, message=None):
+        """
+        Add a row (and its message) to the current batch, flushing once the batch reaches the flush size.
+        """
+        with self._lock:
+            if not self._rows:
+                self._opened_at = time.monotonic()
+            self._rows.append(row)
+            self._messages.append(message)
+            batch = self._take_locked() if len(self._rows) >= self.controller.value else None
+        if batch:
+            self._flush(*batch)
+
+    def flush(self):
+        """
+        Flush the current batch regardless of its size.
+        """
+        with self._lock:
+            batch = self._take_locked()
+        if batch:
+            self._flush(*batch)
+
+    def _take_locked(self):
+        if not self._rows:
+            return None
+        batch = (self._rows, self._messages)
+        self._rows, self._messages, self._opened_at = [], [], None
+        return batch
+
+    def _flush(self, rows, messages):
+        start = time.monotonic()
+        try:
+            errors = self.insert_rows(rows)
+        except Exception as e:
+            latency = time.monotonic() - start
+            logger.error("Failed to insert batch of %d rows: %s", len(rows), e)
+            self.failed_rows += len(rows)
+            self.controller.record(latency=latency, errors=len(rows), total=len(rows), throttled=is_throttle_error(e))
+            for message in messages:
+                if message is not None:
+                    message.nack()
+            return
+        latency = time.monotonic() - start
+
+        failed_indexes = {entry.get("index") for entry in errors or []}
+        if errors:
+            logger.error("Insert rejected %d of %d rows: %s", len(failed_indexes), len(rows), errors)
+            self.failed_rows += len(failed_indexes)
+        for index, message in enumerate(messages):
+            if message is None:
+                continue
+            if index in failed_indexes:
+                message.nack()
+            else:
+                message.ack()
+        self.controller.record(latency=latency, errors=len(failed_indexes), total=len(rows),
+                               throttled=bool(errors) and is_throttle_error(errors))
+        logger.info("Flushed %d rows to BigQuery in %.3fs", len(rows) - len(failed_indexes), latency)
+
+    def _flush_expired(self):
+        while not self._stop.wait(min(0.5, self.max_wait_seconds)):
+            with self._lock:
+                expired = self._opened_at is not None and time.monotonic() - self._opened_at >= self.max_wait_seconds
+                batch = self._take_locked() if expired else None
+            if batch:
+                self._flush(*batch)
+
+    def start(self):
+        """
+        Start the background thread flushing batches older than max_wait_seconds.
+        """
+        self._timer = threading.Thread(target=self._flush_expired, name="batch-flusher", daemon=True)
+        self._timer.start()
+
+    def close(self):
+        """
+        Stop the background thread and flush any buffered rows.
+        """
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
@@ -1,16 +1,38 @@
 import json
 import time
 import logging
-from google.cloud import pubsub_v1, bigquery
-from streaming.transformer import transform_order_event
+from concurrent.futures import ThreadPoolExecutor
+from streaming.transformer import transform_order_event, to_json_row, row_error
+from streaming.envelope import is_envelope, decode_envelope, encode_envelope, EnvelopeAck, ENVELOPE_ATTRIBUTE
+from streaming.order_state import OrderStateStore, StateCheckpointer, TrackedMessage
+from adaptive import AIMDController, ConcurrencyLimiter, is_throttle_error, is_transient_error
+from lazy_import import lazy_import
 import config
+from logging_setup import configure_logging, IntervalSummary
+
+pubsub_v1 = lazy_import("google.cloud.pubsub_v1")
+bigquery = lazy_import("google.cloud.bigquery")
+bigquery_storage_v1 = lazy_import("google.cloud.bigquery_storage_v1")
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+configure_logging()
 logger = logging.getLogger(__name__)
 
 MAX_RETRIES = 3
 
+# Per-row inserts are reported as one summary line per interval instead of one line per row
+insert_summary = IntervalSummary(logger, "Inserted events into BigQuery")
+
+# Row sink (adaptive batches or Parquet segments), set by start_consumer for the "batch" and "file" modes
+row_sink = None
+# Adaptive limit on concurrently running callbacks, set by start_consumer
+concurrency_limiter = None
+# Publisher and topic for invalid events split out of envelopes, set by start_consumer when PUBSUB_DLQ_TOPIC is configured
+dlq_publisher = None
+dlq_topic_path = None
+# Checkpointed latest state per order, set by start_consumer when ORDER_STATE_DIR is configured
+order_state = None
+
 def get_bq_client():
     return bigquery.Client()
 
@@ -24,43 +46,280 @@ def insert_into_bigquery(row: dict):
     table_ref = bq_client.dataset(dataset_id).table(table_id)
 
     for attempt in range(1, MAX_RETRIES + 1):
-        errors = bq_client.insert_rows_json(table_ref, [row])
+        errors = bq_client.insert_rows_json(table_ref, [to_json_row(row)])
         if not errors:
-            logger.info(f"Inserted event {row['order_id']} into BigQuery")
+            insert_summary.add()
             return
         else:
-            logger.error(f"Attempt {attempt}: Error inserting {row['order_id']}: {errors}")
+            logger.error("Attempt %d: Error inserting %s: %s", attempt, row['order_id'], errors)
             if attempt < MAX_RETRIES:
                 time.sleep(2 ** attempt)
             else:
                 raise RuntimeError(f"Failed to insert {row['order_id']} after {MAX_RETRIES} attempts: {errors}")
 
-def callback(message: pubsub_v1.subscriber.message.Message):
+def insert_rows_batch(rows: list):
+    """
+    Insert a batch of transformed rows with a single insert_rows_json call.
+    Returns the per-row error list reported by BigQuery ([] on success).
+    """
+    bq_client = get_bq_client()
+    table_ref = bq_client.dataset(config.DATASET).table(config.ORDER_EVENTS_TABLE)
+    return bq_client.insert_rows_json(table_ref, [to_json_row(row) for row in rows])
+
+def handle_envelope(message):
     """
-    Callback function triggered for each Pub/Sub message.
+    Process a batched envelope message: transform and validate every event, store the valid rows and,
+    once they are stored, publish the invalid ones to the DLQ topic and ack the message. Raises (so the
+    message is nacked whole) when events are invalid and no DLQ topic is configured, or when the rows
+    cannot be inserted.
     """
+    rows, dlq = [], []
+    for raw_event, error in decode_envelope(message.data, message.attributes):
+        if error is None:
+            try:
+                transformed = transform_order_event(raw_event)
+                error = row_error(transformed)
+            except Exception as e:
+                error = str(e)
+        if error is None:
+            rows.append(transformed)
+        else:
+            dlq.append({"event": raw_event, "error": error})
+
+    if dlq and dlq_publisher is None:
+        raise ValueError(f"{len(dlq)} of {len(rows) + len(dlq)} envelope events are invalid and no DLQ topic is configured")
+    if isinstance(message, TrackedMessage):
+        # Applied to the order state when the message is acked
+        message.rows.extend(rows)
+
+    def publish_dlq():
+        if dlq:
+            data, attributes = encode_envelope(dlq, message.attributes[ENVELOPE_ATTRIBUTE])
+            dlq_publisher.publish(dlq_topic_path, data, **attributes).result()
+            logger.warning("Dead-lettered %d of %d envelope events to %s", len(dlq), len(rows) + len(dlq), dlq_topic_path)
+
+    if not rows:
+        publish_dlq()
+        message.ack()
+    elif row_sink is not None:
+        # The DLQ envelope is published and the message acked once the sink has acked every row
+        envelope_ack = EnvelopeAck(message, len(rows), before_ack=publish_dlq)
+        try:
+            for row in rows:
+                row_sink.append(row, envelope_ack)
+        except Exception:
+            envelope_ack.nack()
+            raise
+    else:
+        errors = insert_rows_batch(rows)
+        if errors:
+            raise RuntimeError(f"Insert rejected envelope rows: {errors}")
+        insert_summary.add(len(rows))
+        publish_dlq()
+        message.ack()
+
+def callback(message: "pubsub_v1.subscriber.message.Message"):
+    """
+    Callback function triggered for each Pub/Sub message: a single JSON order event,
+    or a batched envelope of events marked by the envelope attribute.
+    """
+    publish_time = getattr(message, "publish_time", None)
+    if order_state is not None and publish_time is not None:
+        # In flight until acked, so checkpoints never move the position past it while it waits or is buffered
+        message = TrackedMessage(order_state, message, publish_time)
+    limiter = concurrency_limiter
+    if limiter is not None:
+        limiter.acquire()
+    start = time.monotonic()
+    failed = throttled = False
     try:
+        if is_envelope(getattr(message, "attributes", None)):
+            handle_envelope(message)
+            return
         raw_event = json.loads(message.data.decode("utf-8"))
         transformed = transform_order_event(raw_event)
+        if isinstance(message, TrackedMessage) and row_error(transformed) is None:
+            message.rows.append(transformed)
+        if row_sink is not None:
+            reason = row_error(transformed)
+            if reason:
+                # Keep invalid rows out of the shared batch, where they would fail every other row with them
+                logger.warning("Invalid event nacked: %s | Message data: %r", reason, message.data)
+                message.nack()
+                return
+            # Acked by the sink once the row is inserted or its segment is durable
+            row_sink.append(transformed, message)
+            return
         insert_into_bigquery(transformed)
         message.ack()
     except Exception as e:
-        logger.error(f"Error processing message: {e} | Message data: {message.data}")
+        # Only throttling and transport/server failures shrink concurrency; a poison message would halve it on every redelivery
+        failed, throttled = is_transient_error(e), is_throttle_error(e)
+        logger.error("Error processing message: %s | Message data: %r", e, message.data)
         message.nack()
+    finally:
+        if limiter is not None:
+            limiter.release(latency=time.monotonic() - start, error=failed, throttled=throttled)
+
+def build_batch_sink(insert_rows=None):
+    """
+    Create the adaptive batch sink flushing rows with insert_rows (default: insert_rows_json via insert_rows_batch).
+    """
+    from streaming.batch_sink import AdaptiveBatchSink
+
+    controller = AIMDController(
+        "bq_flush_size",
+        initial=config.BQ_FLUSH_SIZE_INITIAL,
+        minimum=config.BQ_FLUSH_SIZE_MIN,
+        maximum=config.BQ_FLUSH_SIZE_MAX,
+        latency_target=config.BQ_FLUSH_LATENCY_TARGET_SECONDS,
+        increase_step=max(1, config.BQ_FLUSH_SIZE_MIN),
+    )
+    return AdaptiveBatchSink(insert_rows or insert_rows_batch, controller, max_wait_seconds=config.BQ_FLUSH_MAX_WAIT_SECONDS)
+
+def build_write_api_sink():
+    """
+    Create an adaptive batch sink that appends Arrow record batches to a COMMITTED Storage Write API stream.
+    Returns (sink, writer); the writer must be closed after the sink to finalize the stream.
+    """
+    from streaming.write_api import CommittedStreamWriter
+
+    write_client = bigquery_storage_v1.BigQueryWriteClient()
+    table_path = write_client.table_path(config.PROJECT_ID, config.DATASET, config.ORDER_EVENTS_TABLE)
+    writer = CommittedStreamWriter(write_client, table_path)
+    return build_batch_sink(insert_rows=writer.insert_rows), writer
+
+def build_concurrency_limiter():
+    """
+    Create the adaptive limiter for concurrently running callbacks.
+    """
+    controller = AIMDController(
+        "callback_concurrency",
+        initial=config.CALLBACK_CONCURRENCY_INITIAL,
+        minimum=config.CALLBACK_CONCURRENCY_MIN,
+        maximum=config.CALLBACK_CONCURRENCY_MAX,
+        latency_target=config.CALLBACK_LATENCY_TARGET_SECONDS,
+    )
+    return ConcurrencyLimiter(controller)
+
+def rebuild_order_state(store, client=None):
+    """
+    Apply the latest order_events row of every order to the store, so it also covers events stored
+    after its last checkpoint. Returns the number of orders whose state changed.
+    """
+    from bq.query import run_query
+
+    client = client or get_bq_client()
+    table = f"{config.PROJECT_ID}.{config.DATASET}.{config.ORDER_EVENTS_TABLE}"
+    query = f"""
+        SELECT order_id, status, amount, event_ts, created_ts
+        FROM `{table}`
+        WHERE order_id IS NOT NULL AND order_id != ''
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY order_id ORDER BY event_ts DESC) = 1
+    """
+    changed = 0
+    for row in run_query(client, query, label="order_state_rebuild").result():
+        changed += store.apply(dict(row.items()))
+    logger.info("Rebuilt order state from %s: %d of %d orders changed", table, changed, len(store))
+    return changed
+
+def build_order_state(client=None):
+    """
+    Load the checkpointed order state and, with ORDER_STATE_REBUILD_ON_START, catch it up from order_events.
+    The subscription is never seeked: a seek to the checkpointed publish time would ack older messages that
+    were never delivered on an unordered subscription. Returns (store, checkpointer).
+    """
+    store = OrderStateStore(config.ORDER_STATE_DIR, max_deltas=config.ORDER_STATE_MAX_DELTAS)
+    store.load()
+    if config.ORDER_STATE_REBUILD_ON_START:
+        rebuild_order_state(store, client)
+    return store, StateCheckpointer(store, interval_seconds=config.ORDER_STATE_CHECKPOINT_INTERVAL_SECONDS)
+
+def build_file_sink():
+    """
+    Create the Parquet segment sink and the committer that batch-loads its segments.
+    """
+    from streaming.file_sink import ParquetSegmentSink, SegmentCommitter, LocalDirectoryTarget, BigQueryLoadTarget
+
+    sink = ParquetSegmentSink(
+        config.FILE_SINK_STAGING_DIR,
+        max_rows=config.FILE_SINK_MAX_ROWS,
+        max_bytes=config.FILE_SINK_MAX_BYTES,
+        max_age_seconds=config.FILE_SINK_MAX_AGE_SECONDS,
+    )
+    if config.FILE_SINK_LOAD_TARGET == "bigquery":
+        table_id = f"{config.PROJECT_ID}.{config.DATASET}.{config.ORDER_EVENTS_TABLE}"
+        if not config.FILE_SINK_GCS_URI:
+            raise ValueError("FILE_SINK_GCS_URI is required when FILE_SINK_LOAD_TARGET=bigquery")
+        from google.cloud import storage
+        target = BigQueryLoadTarget(get_bq_client(), table_id, storage.Client(), config.FILE_SINK_GCS_URI)
+    else:
+        target = LocalDirectoryTarget(config.FILE_SINK_TARGET_DIR)
+    committer = SegmentCommitter(config.FILE_SINK_STAGING_DIR, target, interval_seconds=config.FILE_SINK_COMMIT_INTERVAL_SECONDS)
+    return sink, committer
 
 def start_consumer():
     """
     Start the Pub/Sub subscriber to consume messages.
     """
+    global row_sink, concurrency_limiter, dlq_publisher, dlq_topic_path, order_state
+    # Closed after the sink: the segment committer (file mode) or the write stream (write_api mode)
+    committer = None
+    flow_control = pubsub_v1.types.FlowControl()
+    if config.SINK_MODE == "file":
+        row_sink, committer = build_file_sink()
+        committer.start()
+        # Unacked messages wait for their segment, so allow more than a full segment in flight
+        flow_control = pubsub_v1.types.FlowControl(max_messages=config.FILE_SINK_MAX_ROWS * 2)
+    elif config.SINK_MODE == "batch":
+        row_sink = build_batch_sink()
+        flow_control = pubsub_v1.types.FlowControl(max_messages=config.BQ_FLUSH_SIZE_MAX * 2)
+    elif config.SINK_MODE == "write_api":
+        row_sink, committer = build_write_api_sink()
+        flow_control = pubsub_v1.types.FlowControl(max_messages=config.BQ_FLUSH_SIZE_MAX * 2)
+    if row_sink is not None:
+        row_sink.start()
+
+    if config.PUBSUB_DLQ_TOPIC:
+        dlq_publisher = pubsub_v1.PublisherClient()
+        dlq_topic_path = dlq_publisher.topic_path(config.PROJECT_ID, config.PUBSUB_DLQ_TOPIC)
+
+    # The limiter decides how many callbacks run at once; the pool only has to be large enough for its maximum
+    concurrency_limiter = build_concurrency_limiter()
+    scheduler = pubsub_v1.subscriber.scheduler.ThreadScheduler(
+        executor=ThreadPoolExecutor(max_workers=config.CALLBACK_CONCURRENCY_MAX)
+    )
+
     subscriber = pubsub_v1.SubscriberClient()
     subscription_path = subscriber.subscription_path(
         config.PROJECT_ID, config.PUBSUB_SUBSCRIPTION
     )
-    streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback)
-    logger.info(f"Listening for messages on {subscription_path}...")
+
+    checkpointer = None
+    if config.ORDER_STATE_DIR:
+        order_state, checkpointer = build_order_state()
+        checkpointer.start()
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=callback, flow_control=flow_control, scheduler=scheduler
+    )
+    logger.info("Listening for messages on %s...", subscription_path)
 
     try:
         streaming_pull_future.result()
     except KeyboardInterrupt:
+        if row_sink is not None:
+            # Flush buffered rows while the subscriber can still send their acks
+            row_sink.close()
         streaming_pull_future.cancel()
-        logger.info("Consumer stopped manually.")
\ No newline at end of file
+        logger.info("Consumer stopped manually.")
+    finally:
+        try:
+            if committer is not None:
+                committer.close()
+        finally:
+            if checkpointer is not None:
+                checkpointer.close()
+        row_sink = None
+        concurrency_limiter = None
+        dlq_publisher = dlq_topic_path = None
+        order_state = None
\ No newline at end of file
@@ -0,0 +1,143 @@
+import argparse
+import json
+import zlib
+import logging
+import threading
+from lazy_import import lazy_import
+
+zstandard = lazy_import("zstandard")
+
+logger = logging.getLogger(__name__)
+
+# Message attribute marking a batched envelope; its value names the compression of the payload.
+# Messages without it are single JSON order events.
+ENVELOPE_ATTRIBUTE = "envelope"
+EVENT_COUNT_ATTRIBUTE = "event_count"
+COMPRESSIONS = ("zlib", "zstd")
+
+# Pub/Sub accepts messages up to 10 MB; stay well below it
+DEFAULT_MAX_EVENTS = 1000
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+def compress(data, compression):
+    if compression == "zlib":
+        return zlib.compress(data)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError(f"Unknown envelope compression: {compression}")
+
+def decompress(data, compression):
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown envelope compression: {compression}")
+
+def is_envelope(attributes):
+    return bool(attributes) and ENVELOPE_ATTRIBUTE in attributes
+
+def encode_envelope(events, compression="zlib"):
+    """
+    Pack raw events into one compressed JSONL payload. Returns (data, attributes) for publish().
+    """
+    payload = b"".join(json.dumps(event, default=str).encode("utf-8") + b"\n" for event in events)
+    attributes = {ENVELOPE_ATTRIBUTE: compression, EVENT_COUNT_ATTRIBUTE: str(len(events))}
+    return compress(payload, compression), attributes
+
+def decode_envelope(data, attributes):
+    """
+    Unpack an envelope into a list of (raw_event, error) pairs, one per line. A line that is not valid
+    JSON yields (line, error) so it can be dead-lettered without failing the other events.
+    Raises if the payload itself cannot be decompressed.
+    """
+    events = []
+    for line in decompress(data, attributes[ENVELOPE_ATTRIBUTE]).splitlines():
+        if not line.strip():
+            continue
+        try:
+            events.append((json.loads(line), None))
+        except ValueError as e:
+            events.append((line.decode("utf-8", errors="replace"), f"Invalid JSON: {e}"))
+    return events
+
+def iter_envelopes(events, compression="zlib", max_events=DEFAULT_MAX_EVENTS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Yield (data, attributes) envelopes of at most max_events events and about max_bytes of uncompressed JSON each.
+    """
+    batch, size = [], 0
+    for event in events:
+        event_size = len(json.dumps(event, default=str)) + 1
+        if batch and (len(batch) >= max_events or size + event_size > max_bytes):
+            yield encode_envelope(batch, compression)
+            batch, size = [], 0
+        batch.append(event)
+        size += event_size
+    if batch:
+        yield encode_envelope(batch, compression)
+
+def publish_events(publisher, topic_path, events, compression="zlib", max_events=DEFAULT_MAX_EVENTS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Publish raw order events as compressed envelopes. Returns the publish futures.
+    """
+    futures = []
+    for data, attributes in iter_envelopes(events, compression, max_events, max_bytes):
+        futures.append(publisher.publish(topic_path, data, **attributes))
+    logger.info("Published %d envelopes (%s) to %s", len(futures), compression, topic_path)
+    return futures
+
+class EnvelopeAck:
+    """
+    Stands in for the Pub/Sub message of an envelope when its rows go to a row sink, which acks or
+    nacks per row. The message is acked once every row is acked and nacked on the first nack.
+    before_ack runs once every row is acked; if it raises, the message is nacked instead.
+    """
+
+    def __init__(self, message, rows, before_ack=None):
+        self.message = message
+        self.pending = rows
+        self.before_ack = before_ack
+        self.done = False
+        self._lock = threading.Lock()
+
+    def ack(self):
+        with self._lock:
+            if self.done:
+                return
+            self.pending -= 1
+            if self.pending > 0:
+                return
+            self.done = True
+        if self.before_ack is not None:
+            try:
+                self.before_ack()
+            except Exception as e:
+                logger.error("Envelope rows stored but the message could not be completed: %s", e)
+                self.message.nack()
+                return
+        self.message.ack()
+
+    def nack(self):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+        self.message.nack()
+
+if __name__ == "__main__":
+    import config
+    from logging_setup import configure_logging
+    from google.cloud import pubsub_v1
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Publish a JSONL file of raw order events as compressed envelopes")
+    parser.add_argument("path", help="JSONL file with one raw order event per line")
+    parser.add_argument("--topic", required=True, help="Pub/Sub topic name")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="zlib")
+    parser.add_argument("--max-events", type=int, default=DEFAULT_MAX_EVENTS, help="Events per envelope")
+    args = parser.parse_args()
+
+    publisher = pubsub_v1.PublisherClient()
+    with open(args.path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    for future in publish_events(publisher, publisher.topic_path(config.PROJECT_ID, args.topic), events,
+                                 compression=args.compression, max_events=args.max_events):
+        future.result()
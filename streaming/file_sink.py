@@ -0,0 +1,339 @@
+import json
+import os
+import shutil
+import time
+import uuid
+import logging
+import threading
+import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Arrow schema matching bq/schema.sql order_events
+ORDER_EVENTS_SCHEMA = pa.schema([
+    pa.field("order_id", pa.string(), nullable=False),
+    pa.field("status", pa.string()),
+    pa.field("amount", pa.float64()),
+    pa.field("event_ts", pa.timestamp("us", tz="UTC")),
+    pa.field("created_ts", pa.timestamp("us", tz="UTC")),
+])
+
+SEGMENT_SUFFIX = ".parquet"
+
+def _to_datetime(ts):
+    """
+    Return a UTC datetime for the Arrow timestamp column. Transformer rows already carry datetimes;
+    ISO8601 strings (e.g. rows written before timestamps were typed) are parsed.
+    """
+    if ts is None or isinstance(ts, datetime.datetime):
+        return ts
+    return datetime.datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(datetime.timezone.utc)
+
+def rows_to_table(rows):
+    """
+    Encode transformed order event rows into an Arrow table with the order_events schema.
+    """
+    columns = {
+        "order_id": [row["order_id"] for row in rows],
+        "status": [row.get("status") for row in rows],
+        "amount": [row.get("amount") for row in rows],
+        "event_ts": [_to_datetime(row.get("event_ts")) for row in rows],
+        "created_ts": [_to_datetime(row.get("created_ts")) for row in rows],
+    }
+    return pa.Table.from_pydict(columns, schema=ORDER_EVENTS_SCHEMA)
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class ParquetSegmentSink:
+    """
+    Buffers transformed rows and writes them as compressed Parquet segments into a staging directory.
+    A segment rolls when it reaches max_rows, max_bytes (estimated) or max_age_seconds. The Pub/Sub
+    messages of a segment are acked only after the segment file is fsynced and renamed into place,
+    and nacked if the write fails. Rows of failed segments are counted in failed_rows.
+    """
+
+    def __init__(self, staging_dir, max_rows=10000, max_bytes=64 * 1024 * 1024, max_age_seconds=60, compression="zstd"):
+        self.staging_dir = staging_dir
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.compression = compression
+        self._rows = []
+        self._messages = []
+        self._bytes = 0
+        self._opened_at = None
+        self._sequence = 0
+        self.failed_rows = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = None
+        os.makedirs(staging_dir, exist_ok=True)
+
+    def append(self, row, message=None):
+        """
+        Add a transformed row (and the message to ack once it is durable) to the current segment.
+        """
+        if "dlq_reason" in row or not row.get("order_id"):
+            raise ValueError(f"Row cannot be written to order_events: {row.get('dlq_reason', 'missing order_id')}")
+        with self._lock:
+            if not self._rows:
+                self._opened_at = time.monotonic()
+            self._rows.append(row)
+            if message is not None:
+                self._messages.append(message)
+            self._bytes += sum(len(str(value)) for value in row.values())
+            if len(self._rows) >= self.max_rows or self._bytes >= self.max_bytes:
+                self._roll_locked()
+
+    def roll(self):
+        """
+        Force the current segment to be written, regardless of size or age.
+        """
+        with self._lock:
+            return self._roll_locked()
+
+    def _roll_locked(self):
+        if not self._rows:
+            return None
+        rows, messages = self._rows, self._messages
+        self._rows, self._messages, self._bytes, self._opened_at = [], [], 0, None
+        self._sequence += 1
+        name = f"segment-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence:06d}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.staging_dir, name)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pq.write_table(rows_to_table(rows), f, compression=self.compression)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_dir(self.staging_dir)
+        except Exception as e:
+            logger.error("Failed to write segment %s with %d rows: %s", name, len(rows), e)
+            self.failed_rows += len(rows)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            for message in messages:
+                message.nack()
+            return None
+        for message in messages:
+            message.ack()
+        logger.info("Wrote segment %s with %d rows", name, len(rows))
+        return path
+
+    def _roll_expired(self):
+        while not self._stop.wait(min(1.0, self.max_age_seconds)):
+            with self._lock:
+                if self._opened_at is not None and time.monotonic() - self._opened_at >= self.max_age_seconds:
+                    self._roll_locked()
+
+    def start(self):
+        """
+        Start the background thread rolling segments that exceed max_age_seconds.
+        """
+        self._timer = threading.Thread(target=self._roll_expired, name="segment-roller", daemon=True)
+        self._timer.start()
+
+    def close(self):
+        """
+        Stop the background thread and write any buffered rows.
+        """
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.roll()
+
+class LocalDirectoryTarget:
+    """
+    Stand-in for a BigQuery load job: loading a segment copies it into a local target directory
+    (overwriting a copy left by an earlier attempt, so a retried load does not duplicate it).
+    """
+
+    def __init__(self, target_dir):
+        self.target_dir = target_dir
+        os.makedirs(target_dir, exist_ok=True)
+
+    def load(self, segment_paths, load_id):
+        for path in segment_paths:
+            target_path = os.path.join(self.target_dir, os.path.basename(path))
+            shutil.copyfile(path, f"{target_path}.tmp")
+            os.replace(f"{target_path}.tmp", target_path)
+        _fsync_dir(self.target_dir)
+
+    def cleanup(self, segment_paths):
+        pass
+
+class BigQueryLoadTarget:
+    """
+    Commits segments into a BigQuery table with one Parquet batch load job (WRITE_APPEND) per commit:
+    the segments are uploaded under a GCS prefix and loaded together from their URIs, keeping the
+    number of load jobs per table to one per commit interval.
+
+    Job ids derive from the load_id the committer recorded for the batch, so a retried load finds
+    the job of an earlier attempt instead of loading twice. A failed job is retried under the next
+    attempt id (_r1, _r2, ...), which a later retry checks in the same order; each commit gives up after
+    MAX_ATTEMPTS new failures.
+    """
+
+    # BigQuery accepts at most 10,000 source URIs per load job
+    MAX_URIS_PER_JOB = 10000
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, client, table_id, storage_client, gcs_uri):
+        self.client = client
+        self.table_id = table_id
+        self.storage_client = storage_client
+        bucket, _, prefix = gcs_uri.removeprefix("gs://").partition("/")
+        self.bucket = storage_client.bucket(bucket)
+        self.prefix = prefix.strip("/")
+
+    def _blob_name(self, path):
+        name = os.path.basename(path)
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _run_job(self, uris, job_id, job_config):
+        from google.api_core.exceptions import Conflict
+
+        attempt = failures = 0
+        while True:
+            attempt_id = f"{job_id}_r{attempt}" if attempt else job_id
+            attempt += 1
+            try:
+                job = self.client.load_table_from_uri(uris, self.table_id, job_id=attempt_id, job_config=job_config)
+            except Conflict:
+                job = self.client.get_job(attempt_id)
+                if job.done() and job.error_result:
+                    # Failed in an earlier commit; its retry has the next attempt id
+                    continue
+                logger.warning("Load job %s already exists, waiting for its result", attempt_id)
+            try:
+                job.result()
+            except Exception as e:
+                failures += 1
+                logger.error("Load job %s failed: %s", attempt_id, e)
+                if failures < self.MAX_ATTEMPTS:
+                    continue
+                raise
+            return attempt_id
+
+    def load(self, segment_paths, load_id):
+        from google.cloud import bigquery
+
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        for chunk, start in enumerate(range(0, len(segment_paths), self.MAX_URIS_PER_JOB)):
+            paths = segment_paths[start:start + self.MAX_URIS_PER_JOB]
+            blob_names = [self._blob_name(path) for path in paths]
+            for path, blob_name in zip(paths, blob_names):
+                self.bucket.blob(blob_name).upload_from_filename(path)
+            uris = [f"gs://{self.bucket.name}/{blob_name}" for blob_name in blob_names]
+            job_id = self._run_job(uris, f"order_events_load_{load_id}_{chunk}", job_config)
+            logger.info("Loaded %d segments into %s with load job %s", len(paths), self.table_id, job_id)
+
+    def cleanup(self, segment_paths):
+        from google.api_core.exceptions import NotFound
+
+        for path in segment_paths:
+            try:
+                self.bucket.blob(self._blob_name(path)).delete()
+            except NotFound:
+                pass
+
+class SegmentCommitter:
+    """
+    Periodically commits the durable segments found in the staging directory to a load target.
+
+    Before loading, the batch of segments and its load id are recorded in LOAD_FILE; once the load
+    succeeds the file is marked loaded before the staged segments (and the target's copies) are
+    removed. A commit first finishes a recorded batch: it retries the load with the same segments and
+    load id if it was not marked loaded, else only the cleanup. So a segment is loaded at most once,
+    whatever fails in between, and segments staged later wait for the next batch.
+    """
+
+    LOAD_FILE = "load.json"
+
+    def __init__(self, staging_dir, target, interval_seconds=300):
+        self.staging_dir = staging_dir
+        self.target = target
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pending_segments(self):
+        names = sorted(name for name in os.listdir(self.staging_dir) if name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.staging_dir, name) for name in names]
+
+    def _write_batch(self, batch):
+        path = os.path.join(self.staging_dir, self.LOAD_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        _fsync_dir(self.staging_dir)
+
+    def _read_batch(self):
+        path = os.path.join(self.staging_dir, self.LOAD_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _commit_batch(self, batch):
+        paths = [os.path.join(self.staging_dir, name) for name in batch["segments"]]
+        if not batch["loaded"]:
+            self.target.load(paths, batch["load_id"])
+            batch["loaded"] = True
+            self._write_batch(batch)
+        self.target.cleanup(paths)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        os.remove(os.path.join(self.staging_dir, self.LOAD_FILE))
+        logger.info("Committed %d segments (load %s)", len(paths), batch["load_id"])
+        return len(paths)
+
+    def commit(self):
+        """
+        Finish the recorded batch, if any, then load all pending segments as a new batch.
+        Returns the number of segments committed; raises if a load or cleanup fails.
+        """
+        committed = 0
+        batch = self._read_batch()
+        if batch is not None:
+            committed += self._commit_batch(batch)
+        segments = self.pending_segments()
+        if segments:
+            batch = {"load_id": uuid.uuid4().hex, "segments": [os.path.basename(path) for path in segments], "loaded": False}
+            self._write_batch(batch)
+            committed += self._commit_batch(batch)
+        return committed
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.commit()
+            except Exception as e:
+                logger.error("Failed to commit segments, will retry: %s", e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="segment-committer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop the background thread and commit the remaining segments; raises if they cannot be committed.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.commit()
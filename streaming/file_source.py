@@ -0,0 +1,207 @@
+import argparse
+import gzip
+import json
+import mmap
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from streaming.transformer import transform_order_event
+from pipeline import StagedPipeline, Stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+DEFAULT_GZIP_CHUNK_LINES = 50000
+
+def split_ranges(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Split a JSONL file into (start, end) byte ranges of roughly chunk_bytes that end on line boundaries.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                newline = mm.find(b"\n", end - 1)
+                end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def iter_gzip_chunks(path, chunk_lines=DEFAULT_GZIP_CHUNK_LINES):
+    """
+    Gzip streams cannot be split by offset, so decompress sequentially and yield batches of raw lines.
+    """
+    with gzip.open(path, "rb") as f:
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) >= chunk_lines:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+def transform_lines(lines):
+    """
+    Parse and transform raw JSONL lines. Returns (rows, dlq) where dlq holds {"event", "error"} entries.
+    """
+    rows, dlq = [], []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw_event = json.loads(line)
+            transformed = transform_order_event(raw_event)
+        except Exception as e:
+            dlq.append({"event": line.decode("utf-8", errors="replace"), "error": str(e)})
+            continue
+        if "dlq_reason" in transformed:
+            dlq.append({"event": raw_event, "error": transformed["dlq_reason"]})
+        else:
+            rows.append(transformed)
+    return rows, dlq
+
+def transform_range(path, start, end):
+    """
+    Worker process entry point: memory-map the file and transform the lines in [start, end).
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return transform_lines(mm[start:end].splitlines())
+
+class ReplayProgress:
+    """
+    Counts replayed events and logs progress with events/sec at most every interval_seconds.
+    """
+
+    def __init__(self, total_chunks, interval_seconds=5.0):
+        self.total_chunks = total_chunks
+        self.interval_seconds = interval_seconds
+        self.chunks = 0
+        self.rows = 0
+        self.dlq = 0
+        self.started_at = time.monotonic()
+        self._last_log = self.started_at
+
+    @property
+    def events_per_sec(self):
+        elapsed = time.monotonic() - self.started_at
+        return (self.rows + self.dlq) / elapsed if elapsed > 0 else 0.0
+
+    def update(self, rows, dlq):
+        self.chunks += 1
+        self.rows += rows
+        self.dlq += dlq
+        now = time.monotonic()
+        if now - self._last_log >= self.interval_seconds:
+            self._last_log = now
+            self.log()
+
+    def log(self):
+        total = f"/{self.total_chunks}" if self.total_chunks is not None else ""
+        logger.info("Replay progress: chunks %d%s, rows %d, DLQ %d, %.0f events/sec",
+                    self.chunks, total, self.rows, self.dlq, self.events_per_sec)
+
+def replay_file(path, sink, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES, dlq_path=None, progress_interval=5.0):
+    """
+    Replay a JSONL (or .gz) file of raw order events through transform_order_event into `sink`.
+
+    Chunks are parsed and transformed in worker processes; a StagedPipeline keeps `workers` chunks
+    in flight and feeds each chunk's rows to sink(rows) as soon as it is ready. DLQ entries are
+    appended to dlq_path when given. Returns the ReplayProgress with final counts.
+    """
+    workers = workers or os.cpu_count() or 1
+    if path.endswith(".gz"):
+        chunks = iter_gzip_chunks(path)
+        total_chunks = None
+    else:
+        ranges = split_ranges(path, chunk_bytes)
+        chunks = iter(ranges)
+        total_chunks = len(ranges)
+    progress = ReplayProgress(total_chunks, interval_seconds=progress_interval)
+    dlq_file = open(dlq_path, "a", encoding="utf-8") if dlq_path else None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def parse(chunk):
+            if isinstance(chunk, tuple):
+                return pool.submit(transform_range, path, *chunk).result()
+            return pool.submit(transform_lines, chunk).result()
+
+        def write(result):
+            rows, dlq = result
+            if rows:
+                sink(rows)
+            if dlq_file is not None:
+                for entry in dlq:
+                    dlq_file.write(json.dumps(entry, default=str) + "\n")
+            progress.update(len(rows), len(dlq))
+
+        pipeline = StagedPipeline([
+            Stage("parse", parse, workers=workers, queue_size=workers * 2),
+            Stage("sink", write, workers=1, queue_size=workers * 2),
+        ])
+        try:
+            pipeline.run(chunks)
+        finally:
+            if dlq_file is not None:
+                dlq_file.close()
+
+    progress.log()
+    return progress
+
+def build_sink(kind):
+    """
+    Return (sink, close) for the replay CLI: "file" (Parquet segments), "batch" (adaptive insert_rows_json) or "none".
+    Replayed rows carry no Pub/Sub message to nack, so a failed insert or segment write raises
+    from sink() or close() instead of being dropped, which fails the replay.
+    """
+    if kind == "none":
+        return (lambda rows: None), (lambda: None)
+    from streaming import consumer
+    if kind == "file":
+        row_sink, committer = consumer.build_file_sink()
+        close_sink = committer.close
+    elif kind == "batch":
+        row_sink = consumer.build_batch_sink()
+        close_sink = None
+    else:
+        raise ValueError(f"Unknown sink: {kind}")
+
+    def check():
+        if row_sink.failed_rows:
+            raise RuntimeError(f"{row_sink.failed_rows} replayed rows could not be written by the {kind} sink")
+
+    def sink(rows):
+        for row in rows:
+            row_sink.append(row)
+        check()
+
+    def close():
+        row_sink.close()
+        if close_sink is not None:
+            close_sink()
+        check()
+    return sink, close
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Replay a JSONL file of raw order events through the transformer")
+    parser.add_argument("path", help="JSONL file, optionally gzip-compressed (.gz)")
+    parser.add_argument("--sink", choices=["file", "batch", "none"], default="file", help="Where transformed rows are written")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024), help="Chunk size for uncompressed files")
+    parser.add_argument("--dlq", default=None, help="JSONL file collecting events that failed transformation")
+    args = parser.parse_args()
+
+    sink, close = build_sink(args.sink)
+    try:
+        replay_file(args.path, sink, workers=args.workers, chunk_bytes=args.chunk_mb * 1024 * 1024, dlq_path=args.dlq)
+    finally:
+        close()
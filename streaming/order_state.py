@@ -0,0 +1,324 @@
+import datetime
+import json
+import math
+import os
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Snapshot files: header | records, each record a fixed part followed by the UTF-8 order_id
+MAGIC = b"ORDST01\0"
+HEADER = struct.Struct("<8sQ")     # magic, record count
+RECORD = struct.Struct("<HBdqq")   # order_id length, status code, amount (NaN = NULL), event_ts / created_ts in epoch micros
+NULL_TS = -(2 ** 63)
+STATUSES = ["UNKNOWN", "CREATED", "COMPLETED", "CANCELLED", "FAILED"]
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# Delta record of a deleted order; never written to a base
+TOMBSTONE = 255
+TOMBSTONE_RECORD = (TOMBSTONE, float("nan"), NULL_TS, NULL_TS)
+MANIFEST = "manifest.json"
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def to_micros(ts):
+    if ts is None:
+        return NULL_TS
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    delta = ts - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def from_micros(value):
+    return None if value == NULL_TS else _EPOCH + datetime.timedelta(microseconds=value)
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_snapshot(path, records):
+    """
+    Write {order_id: (status_code, amount, event_ts_us, created_ts_us)} records to path (tmp file + fsync + rename).
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for order_id, (status_code, amount, event_ts, created_ts) in records.items():
+            key = order_id.encode("utf-8")
+            f.write(RECORD.pack(len(key), status_code, amount, event_ts, created_ts))
+            f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_snapshot(path):
+    """
+    Yield (order_id, record) pairs from a snapshot file.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Not an order state snapshot: {path}")
+    offset = HEADER.size
+    for _ in range(count):
+        key_length, status_code, amount, event_ts, created_ts = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        order_id = data[offset:offset + key_length].decode("utf-8")
+        offset += key_length
+        yield order_id, (status_code, amount, event_ts, created_ts)
+
+class OrderStateStore:
+    """
+    Latest valid state per order (status, amount, event_ts, created_ts), checkpointed to `directory`
+    as a base snapshot plus incremental deltas holding only the orders changed since the previous
+    checkpoint. Every max_deltas checkpoints the deltas are compacted into a new base. Deleted orders
+    are written to deltas as tombstones.
+
+    The manifest also records the position it covers: the publish time below which every
+    message has been acked (the oldest message in flight or nacked, or the newest acked one when
+    there is none). It tells operators how far the checkpoint reaches; the consumer never seeks to it.
+    """
+
+    def __init__(self, directory, max_deltas=10):
+        self.directory = directory
+        self.max_deltas = max_deltas
+        self._state = {}
+        self._dirty = set()
+        self._manifest = {"sequence": 0, "base": None, "deltas": [], "position": None}
+        self._acked_publish_us = None
+        self._in_flight = {}
+        self._nacked = set()
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state)
+
+    def __contains__(self, order_id):
+        return order_id in self._state
+
+    def __iter__(self):
+        return iter(list(self._state))
+
+    @property
+    def position(self):
+        return self._manifest["position"]
+
+    def load(self):
+        """
+        Load the base snapshot and deltas listed in the manifest. Returns the checkpointed position or None.
+        """
+        manifest_path = os.path.join(self.directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        state = {}
+        for name in ([manifest["base"]] if manifest["base"] else []) + manifest["deltas"]:
+            state.update(read_snapshot(os.path.join(self.directory, name)))
+        state = {order_id: record for order_id, record in state.items() if record[0] != TOMBSTONE}
+        with self._lock:
+            self._state = state
+            self._dirty = set()
+            self._manifest = manifest
+        logger.info("Loaded state of %d orders from %s at position %s", len(state), self.directory, manifest["position"])
+        return manifest["position"]
+
+    def get(self, order_id):
+        """
+        Return the latest state of an order as a transformed-row dict, or None.
+        """
+        record = self._state.get(order_id)
+        if record is None:
+            return None
+        status_code, amount, event_ts, created_ts = record
+        return {
+            "order_id": order_id,
+            "status": STATUSES[status_code],
+            "amount": None if math.isnan(amount) else amount,
+            "event_ts": from_micros(event_ts),
+            "created_ts": from_micros(created_ts),
+        }
+
+    def apply(self, row):
+        """
+        Apply a transformed row, keeping it when its event_ts is newer than the stored one.
+        Returns True if the order's state changed.
+        """
+        event_ts = to_micros(row.get("event_ts"))
+        record = (
+            STATUS_CODES.get(row.get("status"), 0),
+            float("nan") if row.get("amount") is None else float(row["amount"]),
+            event_ts,
+            to_micros(row.get("created_ts")),
+        )
+        with self._lock:
+            current = self._state.get(row["order_id"])
+            if current is not None and current[2] >= event_ts:
+                return False
+            self._state[row["order_id"]] = record
+            self._dirty.add(row["order_id"])
+            return True
+
+    def delete(self, order_id):
+        """
+        Remove an order. Returns True if it was stored.
+        """
+        with self._lock:
+            if self._state.pop(order_id, None) is None:
+                return False
+            self._dirty.add(order_id)
+            return True
+
+    def begin(self, publish_time):
+        """
+        Mark a message as in flight, so checkpoints do not advance the position past it.
+        """
+        publish_us = to_micros(publish_time)
+        with self._lock:
+            self._in_flight[publish_us] = self._in_flight.get(publish_us, 0) + 1
+
+    def finish(self, publish_time, acked=True):
+        """
+        Release an in-flight message. A nacked message keeps pinning the position until a message
+        with the same publish time (its redelivery) is acked.
+        """
+        publish_us = to_micros(publish_time)
+        with self._lock:
+            remaining = self._in_flight.get(publish_us, 0) - 1
+            if remaining > 0:
+                self._in_flight[publish_us] = remaining
+            else:
+                self._in_flight.pop(publish_us, None)
+            if not acked:
+                self._nacked.add(publish_us)
+                return
+            self._nacked.discard(publish_us)
+            if self._acked_publish_us is None or publish_us > self._acked_publish_us:
+                self._acked_publish_us = publish_us
+
+    def _position_locked(self):
+        pinned = self._in_flight.keys() | self._nacked
+        publish_us = min(pinned) if pinned else self._acked_publish_us
+        if publish_us is None:
+            return self._manifest["position"]
+        return {"publish_time": from_micros(publish_us).isoformat()}
+
+    def checkpoint(self):
+        """
+        Write the orders changed since the last checkpoint as a delta (or a new base when there is none
+        yet or max_deltas is reached) and atomically switch the manifest to it. Returns the file written or None.
+        """
+        with self._checkpoint_lock:
+            with self._lock:
+                position = self._position_locked()
+                compact = self._manifest["base"] is None or len(self._manifest["deltas"]) >= self.max_deltas
+                if not self._dirty and position == self._manifest["position"]:
+                    return None
+                records = dict(self._state) if compact else {order_id: self._state.get(order_id, TOMBSTONE_RECORD) for order_id in self._dirty}
+                dirty, self._dirty = self._dirty, set()
+
+            os.makedirs(self.directory, exist_ok=True)
+            sequence = self._manifest["sequence"] + 1
+            name = f"{'base' if compact else 'delta'}-{sequence:06d}.bin"
+            previous = self._manifest
+            manifest = {
+                "sequence": sequence,
+                "base": name if compact else previous["base"],
+                "deltas": [] if compact else previous["deltas"] + [name],
+                "position": position,
+            }
+            try:
+                write_snapshot(os.path.join(self.directory, name), records)
+                tmp_path = os.path.join(self.directory, f"{MANIFEST}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, os.path.join(self.directory, MANIFEST))
+                _fsync_dir(self.directory)
+            except Exception:
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+            self._manifest = manifest
+
+            if compact:
+                for old_name in ([previous["base"]] if previous["base"] else []) + previous["deltas"]:
+                    os.remove(os.path.join(self.directory, old_name))
+            logger.info("Checkpointed %d orders to %s at position %s", len(records), name, position)
+            return name
+
+class TrackedMessage:
+    """
+    Wraps a Pub/Sub message (or EnvelopeAck) for an OrderStateStore: the message is in flight from
+    creation, its stored rows are applied to the store only when it is acked, and a nack keeps its
+    publish time pinned. Other attributes (data, attributes, ...) are those of the wrapped message.
+    """
+
+    def __init__(self, store, message, publish_time):
+        self.store = store
+        self.message = message
+        self.publish_time = publish_time
+        self.rows = []
+        self.done = False
+        self._lock = threading.Lock()
+        store.begin(publish_time)
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+    def ack(self):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+        for row in self.rows:
+            self.store.apply(row)
+        self.message.ack()
+        self.store.finish(self.publish_time)
+
+    def nack(self):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+        self.message.nack()
+        self.store.finish(self.publish_time, acked=False)
+
+class StateCheckpointer:
+    """
+    Periodically checkpoints an OrderStateStore from a background thread, and once more on close.
+    """
+
+    def __init__(self, store, interval_seconds=60):
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def checkpoint(self):
+        try:
+            return self.store.checkpoint()
+        except Exception as e:
+            logger.error("Failed to checkpoint order state, will retry: %s", e)
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.checkpoint()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="state-checkpointer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.checkpoint()
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import datetime
 
 VALID_STATUSES = {"CREATED", "COMPLETED", "FAILED", "CANCELLED"}
@@ -7,6 +7,7 @@ def transform_order_event(raw_event: Dict[str, Any]) -> Dict[str, Any]:
     """
     Transforms a raw order event JSON into the schema expected for BigQuery.
     Validates amount, status, and timestamp fields. Returns a dict with dlq_reason if invalid.
+    event_ts and created_ts are timezone-aware UTC datetimes matching the TIMESTAMP columns.
     """
     try:
         amount = raw_event.get("amount")
@@ -29,7 +30,7 @@ def transform_order_event(raw_event: Dict[str, Any]) -> Dict[str, Any]:
             status = status.upper()
 
         event_ts = _parse_timestamp(raw_event.get("timestamp"))
-        # event_ts must be a valid ISO8601 timestamp string
+        # event_ts must be a valid timestamp
         if event_ts is None:
             return {"dlq_reason": "Invalid timestamp: unparseable or missing"}
 
@@ -37,7 +38,7 @@ def transform_order_event(raw_event: Dict[str, Any]) -> Dict[str, Any]:
         created_ts = _parse_timestamp(created_at_raw)
         # If created_at is missing or unparseable, use current UTC timestamp
         if created_at_raw is None or created_ts is None:
-            created_ts = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+            created_ts = datetime.datetime.now(datetime.timezone.utc)
 
         transformed = {
             "order_id": str(raw_event.get("id", "")),
@@ -50,9 +51,19 @@ def transform_order_event(raw_event: Dict[str, Any]) -> Dict[str, Any]:
     except Exception as e:
         return {"dlq_reason": f"Error transforming event: {e}"}
 
-def _parse_timestamp(ts: Any) -> str:
+def row_error(row: Dict[str, Any]) -> Optional[str]:
     """
-    Ensures the timestamp is ISO8601 string in UTC for BigQuery.
+    Returns why a transformed row cannot be written to order_events, or None if it can.
+    """
+    if "dlq_reason" in row:
+        return row["dlq_reason"]
+    if not row.get("order_id"):
+        return "missing order_id"
+    return None
+
+def _parse_timestamp(ts: Any) -> Optional[datetime.datetime]:
+    """
+    Parses the timestamp into a timezone-aware UTC datetime for BigQuery TIMESTAMP columns.
     Returns None if unparseable.
     """
     if ts is None:
@@ -62,27 +73,38 @@ def _parse_timestamp(ts: Any) -> str:
         # If naive datetime, assume UTC
         if ts.tzinfo is None:
             ts = ts.replace(tzinfo=datetime.timezone.utc)
-        return ts.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+        return ts.astimezone(datetime.timezone.utc)
         
     elif isinstance(ts, str):
         try:
             # Attempt ISO8601 parsing with timezone info
             parsed = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            return parsed.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            return parsed.astimezone(datetime.timezone.utc)
         except ValueError:
             pass
         try:
             # Attempt parsing common non-ISO format: "dd/mm/YYYY HH:MM:SS"
             parsed = datetime.datetime.strptime(ts, "%d/%m/%Y %H:%M:%S")
-            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
-            return parsed.isoformat().replace('+00:00', 'Z')
+            return parsed.replace(tzinfo=datetime.timezone.utc)
         except ValueError:
             return None
             
     elif isinstance(ts, (int, float)):
         try:
             # Assume ts is a UNIX timestamp in seconds
-            return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+            return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
         except Exception:
             return None
-    return None
\ No newline at end of file
+    return None
+
+def to_json_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns a copy of a transformed row with datetimes rendered as RFC 3339 strings,
+    for JSON boundaries such as insert_rows_json.
+    """
+    return {
+        key: value.isoformat().replace('+00:00', 'Z') if isinstance(value, datetime.datetime) else value
+        for key, value in row.items()
+    }
@@ -0,0 +1,243 @@
+import logging
+import threading
+from concurrent.futures import Future
+import pyarrow as pa
+from streaming.file_sink import ORDER_EVENTS_SCHEMA, rows_to_table
+from streaming.transformer import row_error
+from lazy_import import lazy_import
+
+bigquery_storage_v1 = lazy_import("google.cloud.bigquery_storage_v1")
+api_exceptions = lazy_import("google.api_core.exceptions")
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+
+# google.rpc.Code values returned in AppendRowsResponse.error
+ALREADY_EXISTS = 6
+OUT_OF_RANGE = 11
+
+def encode_record_batch(rows):
+    """
+    Encode transformed rows into one Arrow record batch with the order_events schema.
+    """
+    return rows_to_table(rows).combine_chunks().to_batches()[0]
+
+def serialize_schema(schema=ORDER_EVENTS_SCHEMA):
+    return schema.serialize().to_pybytes()
+
+def serialize_record_batch(batch):
+    return batch.serialize().to_pybytes()
+
+class CommittedStreamWriter:
+    """
+    Appends Arrow-encoded rows to a COMMITTED Storage Write API stream: rows are visible as soon as
+    an append succeeds. Each append carries the expected stream offset, so a retried append of the
+    same rows is reported as ALREADY_EXISTS instead of being written twice.
+
+    Appends go over one long-lived AppendRowsStream per write stream, which sends the writer schema
+    once and the routing header the service needs. `client` is a BigQueryWriteClient; `open_stream`
+    builds the append connection from its first request and defaults to AppendRowsStream
+    (LocalWriteServer.open_append_stream in tests).
+    """
+
+    def __init__(self, client, table_path, open_stream=None):
+        self.client = client
+        self.table_path = table_path
+        self.open_stream = open_stream or (lambda template: bigquery_storage_v1.writer.AppendRowsStream(client, template))
+        self.stream_name = None
+        self.offset = 0
+        self._append_stream = None
+        self._schema_bytes = serialize_schema()
+        self._lock = threading.Lock()
+
+    def _ensure_stream(self):
+        if self.stream_name is None:
+            types = bigquery_storage_v1.types
+            stream = self.client.create_write_stream(
+                parent=self.table_path,
+                write_stream=types.WriteStream(type_=types.WriteStream.Type.COMMITTED),
+            )
+            self.stream_name = stream.name
+            self._append_stream = self.open_stream(types.AppendRowsRequest(
+                write_stream=self.stream_name,
+                arrow_rows=types.AppendRowsRequest.ArrowData(
+                    writer_schema=types.ArrowSchema(serialized_schema=self._schema_bytes),
+                ),
+            ))
+            logger.info("Opened committed write stream %s", self.stream_name)
+
+    def _abandon_stream(self):
+        append_stream, self._append_stream = self._append_stream, None
+        self.stream_name, self.offset = None, 0
+        try:
+            append_stream.close()
+        except Exception as e:
+            logger.warning("Failed to close append stream: %s", e)
+
+    def append(self, rows):
+        """
+        Append rows at the current offset, retrying the identical request on transport errors.
+        ALREADY_EXISTS on a retry means the earlier attempt was committed. If all attempts fail the
+        stream is abandoned, so rows redelivered later go to a fresh stream instead of reusing offsets.
+        Returns the offset the rows were written at.
+        """
+        types = bigquery_storage_v1.types
+        batch = encode_record_batch(rows)
+        with self._lock:
+            self._ensure_stream()
+            # The schema and stream name travel in the stream's first request only
+            request = types.AppendRowsRequest(
+                offset=self.offset,
+                arrow_rows=types.AppendRowsRequest.ArrowData(
+                    rows=types.ArrowRecordBatch(serialized_record_batch=serialize_record_batch(batch), row_count=batch.num_rows),
+                ),
+            )
+            for attempt in range(1, MAX_RETRIES + 1):
+                try:
+                    response = self._append_stream.send(request).result()
+                except api_exceptions.AlreadyExists:
+                    if attempt == 1:
+                        stream_name = self.stream_name
+                        self._abandon_stream()
+                        raise RuntimeError(f"Append to {stream_name} rejected: offset already written")
+                    logger.warning("Rows at offset %d were committed by an earlier attempt", self.offset)
+                    break
+                except (api_exceptions.OutOfRange, api_exceptions.InvalidArgument, api_exceptions.NotFound) as e:
+                    stream_name = self.stream_name
+                    self._abandon_stream()
+                    raise RuntimeError(f"Append to {stream_name} rejected: {e}") from e
+                except Exception as e:
+                    logger.error("Attempt %d: append to %s at offset %d failed: %s", attempt, self.stream_name, self.offset, e)
+                    if attempt < MAX_RETRIES:
+                        continue
+                    self._abandon_stream()
+                    raise
+                if response.row_errors:
+                    stream_name = self.stream_name
+                    self._abandon_stream()
+                    raise RuntimeError(f"Append to {stream_name} rejected: {list(response.row_errors)}")
+                break
+            offset = self.offset
+            self.offset += batch.num_rows
+            return offset
+
+    def insert_rows(self, rows):
+        """
+        AdaptiveBatchSink adapter: append the valid rows and return insert_rows_json-style errors for
+        rows that cannot be encoded (dead-lettered or missing order_id), so only their messages are
+        nacked instead of the whole batch failing. Append failures raise.
+        """
+        errors = []
+        valid = []
+        for index, row in enumerate(rows):
+            reason = row_error(row)
+            if reason:
+                errors.append({"index": index, "errors": [{"reason": "invalid", "message": reason}]})
+            else:
+                valid.append(row)
+        if valid:
+            self.append(valid)
+        return errors
+
+    def close(self):
+        """
+        Finalize the stream so no further appends are accepted.
+        """
+        with self._lock:
+            if self.stream_name is not None:
+                self._append_stream.close()
+                self._append_stream = None
+                response = self.client.finalize_write_stream(name=self.stream_name)
+                logger.info("Finalized write stream %s with %d rows", self.stream_name, response.row_count)
+                self.stream_name = None
+
+class LocalWriteServer:
+    """
+    In-process stand-in for the BigQueryWriteClient methods used by CommittedStreamWriter.
+    Decodes the Arrow payloads, enforces stream offsets and keeps committed rows per table.
+    """
+
+    def __init__(self):
+        self.streams = {}
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def create_write_stream(self, parent=None, write_stream=None):
+        types = bigquery_storage_v1.types
+        with self._lock:
+            name = f"{parent}/streams/local-{len(self.streams) + 1}"
+            self.streams[name] = {"table": parent, "rows": 0, "finalized": False, "schema": None}
+            self.tables.setdefault(parent, [])
+        return types.WriteStream(name=name, type_=write_stream.type_)
+
+    def open_append_stream(self, template):
+        """
+        Open a LocalAppendStream, the AppendRowsStream stand-in, whose first request is merged with template.
+        """
+        return LocalAppendStream(self, template)
+
+    def append(self, request):
+        """
+        Apply one AppendRowsRequest and return its AppendRowsResponse.
+        """
+        types = bigquery_storage_v1.types
+        with self._lock:
+            stream = self.streams.get(request.write_stream)
+            if stream is None or stream["finalized"]:
+                return types.AppendRowsResponse(error={"code": 5, "message": "stream not found or finalized"})
+            if request.arrow_rows.writer_schema.serialized_schema:
+                stream["schema"] = pa.ipc.read_schema(pa.py_buffer(request.arrow_rows.writer_schema.serialized_schema))
+            batch = pa.ipc.read_record_batch(pa.py_buffer(request.arrow_rows.rows.serialized_record_batch), stream["schema"])
+            if "offset" in request and request.offset < stream["rows"]:
+                return types.AppendRowsResponse(error={"code": ALREADY_EXISTS, "message": "offset already written"})
+            if "offset" in request and request.offset > stream["rows"]:
+                return types.AppendRowsResponse(error={"code": OUT_OF_RANGE, "message": "offset beyond end of stream"})
+            offset = stream["rows"]
+            stream["rows"] += batch.num_rows
+            self.tables[stream["table"]].append(batch)
+        return types.AppendRowsResponse(append_result={"offset": offset})
+
+    def finalize_write_stream(self, name=None):
+        types = bigquery_storage_v1.types
+        with self._lock:
+            stream = self.streams[name]
+            stream["finalized"] = True
+        return types.FinalizeWriteStreamResponse(row_count=stream["rows"])
+
+    def read_table(self, table_path):
+        """
+        Return all committed rows of a table as an Arrow table.
+        """
+        batches = self.tables.get(table_path, [])
+        return pa.Table.from_batches(batches, schema=ORDER_EVENTS_SCHEMA)
+
+class LocalAppendStream:
+    """
+    In-process stand-in for AppendRowsStream on a LocalWriteServer: the template is merged into the
+    first request, the stream name into every request, and send() returns a resolved future that raises the error status like the real stream.
+    """
+
+    def __init__(self, server, template):
+        self.server = server
+        self.template = template
+        self.first = True
+        self.closed = False
+
+    def send(self, request):
+        types = bigquery_storage_v1.types
+        merged = types.AppendRowsRequest(write_stream=self.template.write_stream)
+        if self.first:
+            types.AppendRowsRequest.pb(merged).MergeFrom(types.AppendRowsRequest.pb(self.template))
+            self.first = False
+        types.AppendRowsRequest.pb(merged).MergeFrom(types.AppendRowsRequest.pb(request))
+        response = self.server.append(merged)
+        future = Future()
+        if response.error.code:
+            future.set_exception(api_exceptions.from_grpc_status(response.error.code, response.error.message, response=response))
+        else:
+            future.set_result(response)
+        return future
+
+    def close(self):
+        self.closed = True
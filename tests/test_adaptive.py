@@ -0,0 +1,55 @@
+import threading
+import pytest
+from adaptive import AIMDController, ConcurrencyLimiter, is_throttle_error, is_transient_error
+
+def test_controller_additive_increase_within_bounds():
+    controller = AIMDController("test", initial=8, minimum=2, maximum=10, increase_step=1)
+    for _ in range(5):
+        controller.record(latency=0.1)
+    assert controller.value == 10
+
+def test_controller_multiplicative_decrease_on_latency_errors_and_throttle(caplog):
+    caplog.set_level("INFO")
+    controller = AIMDController("test", initial=64, minimum=5, maximum=100, latency_target=1.0)
+    assert controller.record(latency=2.0) == 32
+    assert controller.record(latency=0.1, errors=1, total=10) == 16
+    assert controller.record(latency=0.1, throttled=True) == 8
+    assert controller.record(latency=0.1, throttled=True) == 5
+    assert "[test] decrease 64 -> 32" in caplog.text
+
+def test_controller_rejects_initial_outside_bounds():
+    with pytest.raises(ValueError):
+        AIMDController("test", initial=1, minimum=2, maximum=10)
+
+def test_is_throttle_error():
+    class TooManyRequests(Exception):
+        code = 429
+    assert is_throttle_error(TooManyRequests("slow down"))
+    assert is_throttle_error([{"index": 0, "errors": [{"reason": "rateLimitExceeded"}]}])
+    assert not is_throttle_error(ValueError("bad row"))
+
+def test_concurrency_limiter_blocks_at_limit():
+    limiter = ConcurrencyLimiter(AIMDController("test", initial=1, minimum=1, maximum=2))
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        acquired.set()
+        limiter.release(latency=0.0)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(latency=0.0)
+    assert acquired.wait(1.0)
+    thread.join()
+    assert limiter.active == 0
+
+def test_transient_errors_exclude_data_errors():
+    from google.api_core.exceptions import ServiceUnavailable, BadRequest
+    assert is_transient_error(ServiceUnavailable("unavailable"))
+    assert is_transient_error(ConnectionError("reset"))
+    assert is_transient_error(RuntimeError("quotaExceeded"))
+    assert not is_transient_error(ValueError("Expecting value"))
+    assert not is_transient_error(BadRequest("invalid row"))
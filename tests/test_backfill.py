@@ -0,0 +1,68 @@
+import json
+import pytest
+from datetime import date
+from unittest.mock import patch, MagicMock
+from aggregation import backfill
+
+def test_partition_dates_daily_chunks():
+    dates = backfill.partition_dates(date(2025, 9, 29), date(2025, 10, 2))
+    assert dates == [date(2025, 9, 29), date(2025, 9, 30), date(2025, 10, 1), date(2025, 10, 2)]
+
+def test_partition_dates_invalid_range():
+    with pytest.raises(ValueError):
+        backfill.partition_dates(date(2025, 10, 2), date(2025, 10, 1))
+
+@patch("aggregation.backfill.bigquery.Client")
+def test_run_backfill_checkpoints_and_resumes(mock_client_cls, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps({"start": "2025-10-01", "end": "2025-10-03", "completed": ["2025-10-01"]}))
+    mock_client = MagicMock()
+    mock_client_cls.return_value = mock_client
+
+    failed = backfill.run_backfill(date(2025, 10, 1), date(2025, 10, 3), workers=2, checkpoint_path=str(checkpoint))
+
+    assert failed == []
+    # The already completed partition is skipped
+    assert mock_client.query.call_count == 2
+    destinations = sorted(call.kwargs["job_config"].destination.table_id for call in mock_client.query.call_args_list)
+    assert destinations == ["orders$20251002", "orders$20251003"]
+    # A fully successful run removes its checkpoint, so the next backfill starts from scratch
+    assert not checkpoint.exists()
+
+@patch("aggregation.backfill.backfill_partition")
+@patch("aggregation.backfill.bigquery.Client")
+def test_run_backfill_failed_partition_not_checkpointed(mock_client_cls, mock_partition, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+
+    def side_effect(client, partition_date):
+        if partition_date == date(2025, 10, 2):
+            raise RuntimeError("quota exceeded")
+
+    mock_partition.side_effect = side_effect
+
+    failed = backfill.run_backfill(date(2025, 10, 1), date(2025, 10, 3), workers=3, checkpoint_path=str(checkpoint))
+
+    assert failed == [date(2025, 10, 2)]
+    assert json.loads(checkpoint.read_text())["completed"] == ["2025-10-01", "2025-10-03"]
+
+@patch("aggregation.backfill.bigquery.Client")
+def test_run_backfill_ignores_checkpoint_of_other_range(mock_client_cls, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps({"start": "2025-09-01", "end": "2025-10-31", "completed": ["2025-10-01"]}))
+    mock_client = MagicMock()
+    mock_client_cls.return_value = mock_client
+
+    backfill.run_backfill(date(2025, 10, 1), date(2025, 10, 2), checkpoint_path=str(checkpoint))
+
+    assert mock_client.query.call_count == 2
+
+@patch("aggregation.backfill.bigquery.Client")
+def test_run_backfill_restart_rebuilds_every_partition(mock_client_cls, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps({"start": "2025-10-01", "end": "2025-10-02", "completed": ["2025-10-01"]}))
+    mock_client = MagicMock()
+    mock_client_cls.return_value = mock_client
+
+    backfill.run_backfill(date(2025, 10, 1), date(2025, 10, 2), checkpoint_path=str(checkpoint), restart=True)
+
+    assert mock_client.query.call_count == 2
@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+from adaptive import AIMDController
+from streaming.batch_sink import AdaptiveBatchSink
+
+class DummyMessage:
+    def __init__(self):
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+def make_sink(insert_rows, initial=2):
+    controller = AIMDController("flush", initial=initial, minimum=1, maximum=10, latency_target=1.0)
+    return AdaptiveBatchSink(insert_rows, controller), controller
+
+def test_flushes_at_flush_size_and_grows():
+    insert_rows = MagicMock(return_value=[])
+    sink, controller = make_sink(insert_rows)
+    messages = [DummyMessage() for _ in range(2)]
+
+    for i, message in enumerate(messages):
+        sink.append({"order_id": f"order{i}"}, message)
+
+    insert_rows.assert_called_once_with([{"order_id": "order0"}, {"order_id": "order1"}])
+    assert all(m.acked for m in messages)
+    assert controller.value == 3
+
+def test_rejected_rows_nacked_and_flush_size_shrinks():
+    insert_rows = MagicMock(return_value=[{"index": 1, "errors": [{"reason": "invalid"}]}])
+    sink, controller = make_sink(insert_rows, initial=4)
+    messages = [DummyMessage() for _ in range(4)]
+
+    for i, message in enumerate(messages):
+        sink.append({"order_id": f"order{i}"}, message)
+
+    assert [m.acked for m in messages] == [True, False, True, True]
+    assert messages[1].nacked is True
+    assert controller.value == 2
+
+def test_insert_exception_nacks_batch_on_close():
+    insert_rows = MagicMock(side_effect=RuntimeError("429 rateLimitExceeded"))
+    sink, controller = make_sink(insert_rows, initial=8)
+    message = DummyMessage()
+    sink.append({"order_id": "order1"}, message)
+
+    sink.close()
+
+    assert message.nacked is True
+    assert controller.value == 4
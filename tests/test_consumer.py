@@ -154,4 +154,86 @@ def test_callback_multiple_events_dlq(monkeypatch):
     assert messages[1].acked is True
     assert messages[1].nacked is False
     assert messages[2].acked is False
-    assert messages[2].nacked is True
\ No newline at end of file
+    assert messages[2].nacked is True
+
+def test_callback_file_sink_defers_ack(monkeypatch):
+    raw_event = {
+        "id": "order_file",
+        "status": "CREATED",
+        "amount": 10,
+        "timestamp": "2025-10-01T12:00:00Z",
+        "created_at": "2025-10-01T11:59:00Z"
+    }
+    message = DummyMessage(data=json.dumps(raw_event).encode("utf-8"))
+    sink = MagicMock()
+    monkeypatch.setattr(consumer, "row_sink", sink)
+
+    consumer.callback(message)
+
+    sink.append.assert_called_once()
+    assert sink.append.call_args[0][0]["order_id"] == "order_file"
+    # Ack is left to the sink once the segment is durable
+    assert message.acked is False
+    assert message.nacked is False
+
+
+def test_callback_reports_outcome_to_concurrency_limiter(monkeypatch):
+    message = DummyMessage(data=b'{"id": "order_limited"}')
+    limiter = MagicMock()
+    monkeypatch.setattr(consumer, "concurrency_limiter", limiter)
+
+    with patch('streaming.consumer.transform_order_event', side_effect=ValueError("Transform failed")):
+        consumer.callback(message)
+
+    limiter.acquire.assert_called_once()
+    # A data error recurs on every redelivery and must not shrink concurrency
+    assert limiter.release.call_args.kwargs["error"] is False
+    assert message.nacked is True
+
+def test_callback_reports_transport_errors_to_concurrency_limiter(monkeypatch):
+    message = DummyMessage(data=b'{"id": "order1", "status": "CREATED", "amount": 10, "timestamp": "2025-10-01T12:00:00Z"}')
+    limiter = MagicMock()
+    monkeypatch.setattr(consumer, "concurrency_limiter", limiter)
+
+    with patch('streaming.consumer.insert_into_bigquery', side_effect=ConnectionError("connection reset")):
+        consumer.callback(message)
+
+    assert limiter.release.call_args.kwargs["error"] is True
+    assert message.nacked is True
+
+def test_insert_rows_batch_serializes_typed_timestamps(monkeypatch):
+    mock_client = MagicMock()
+    mock_client.insert_rows_json.return_value = []
+    monkeypatch.setattr(consumer, "get_bq_client", lambda: mock_client)
+    row = consumer.transform_order_event({"id": "order1", "status": "CREATED", "amount": 10,
+                                          "timestamp": "01/10/2025 12:00:00", "created_at": "2025-10-01T13:59:00+02:00"})
+
+    # The transformer emits UTC datetimes; they are only rendered as text at the JSON boundary
+    assert row["event_ts"].isoformat() == "2025-10-01T12:00:00+00:00"
+    consumer.insert_rows_batch([row])
+
+    sent = mock_client.insert_rows_json.call_args[0][1]
+    assert sent[0]["event_ts"] == "2025-10-01T12:00:00Z"
+    assert sent[0]["created_ts"] == "2025-10-01T11:59:00Z"
+    json.dumps(sent)
+
+def test_callback_batch_mode_nacks_only_invalid_event(monkeypatch):
+    from adaptive import AIMDController
+    from streaming.batch_sink import AdaptiveBatchSink
+    insert_rows = MagicMock(return_value=[])
+    controller = AIMDController("test_flush", initial=2, minimum=1, maximum=10)
+    monkeypatch.setattr(consumer, "row_sink", AdaptiveBatchSink(insert_rows, controller))
+    events = [
+        {"id": "order1", "status": "CREATED", "amount": 10, "timestamp": "2025-10-01T12:00:00Z"},
+        {"id": "negative", "status": "CREATED", "amount": -5, "timestamp": "2025-10-01T12:00:00Z"},
+        {"id": "order2", "status": "CREATED", "amount": 20, "timestamp": "2025-10-01T12:00:00Z"},
+    ]
+    messages = [DummyMessage(json.dumps(event).encode("utf-8")) for event in events]
+
+    for message in messages:
+        consumer.callback(message)
+
+    insert_rows.assert_called_once()
+    assert [row["order_id"] for row in insert_rows.call_args[0][0]] == ["order1", "order2"]
+    assert [(m.acked, m.nacked) for m in messages] == [(True, False), (False, True), (True, False)]
+    assert controller.value >= 2
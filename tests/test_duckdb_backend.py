@@ -0,0 +1,52 @@
+import json
+import duckdb
+import pytest
+from aggregation import duckdb_backend, etl
+
+sample_events = [
+    {"order_id": "order1", "status": "CREATED", "amount": 10, "event_ts": "2025-10-01T12:00:00Z", "created_ts": "2025-10-01T11:59:00Z"},
+    {"order_id": "order1", "status": "COMPLETED", "amount": 10, "event_ts": "2025-10-01T13:00:00Z", "created_ts": "2025-10-01T11:59:00Z"},
+    {"order_id": "order2", "status": "CREATED", "amount": 20, "event_ts": "2025-10-01T14:00:00Z", "created_ts": "2025-10-01T13:59:00Z"},
+    {"order_id": "order2", "status": "FAILED", "amount": 20, "event_ts": "INVALID_TS", "created_ts": "2025-10-01T13:59:00Z"},
+    {"order_id": "order3"}
+]
+
+@pytest.fixture
+def events_file(tmp_path):
+    path = tmp_path / "order_events.jsonl"
+    path.write_text("\n".join(json.dumps(e) for e in sample_events) + "\n")
+    return path
+
+def test_local_consolidation_latest_state_and_dlq(events_file, tmp_path):
+    output_dir = tmp_path / "out"
+    stats = duckdb_backend.run_consolidation(str(events_file), str(output_dir))
+
+    assert stats["orders_rows"] == 2
+    assert stats["dlq_rows"] == 2
+
+    orders = duckdb.sql(f"SELECT order_id, status, strftime(event_ts, '%Y-%m-%dT%H:%M:%SZ') FROM '{output_dir / 'orders.parquet'}' ORDER BY order_id").fetchall()
+    assert orders == [
+        ("order1", "COMPLETED", "2025-10-01T13:00:00Z"),
+        ("order2", "CREATED", "2025-10-01T14:00:00Z"),
+    ]
+    types = duckdb.sql(f"SELECT typeof(event_ts), typeof(created_ts) FROM '{output_dir / 'orders.parquet'}' LIMIT 1").fetchone()
+    assert types == ("TIMESTAMP WITH TIME ZONE", "TIMESTAMP WITH TIME ZONE")
+    dlq = duckdb.sql(f"SELECT event FROM '{output_dir / 'order_events_dlq.parquet'}'").fetchall()
+    dlq_ids = sorted(json.loads(row[0])["order_id"] for row in dlq)
+    assert dlq_ids == ["order2", "order3"]
+
+def test_etl_selects_duckdb_backend(events_file, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    monkeypatch.setattr(etl, "CONSOLIDATION_BACKEND", "duckdb")
+    monkeypatch.setattr(etl, "LOCAL_EVENTS_PATH", str(events_file))
+    monkeypatch.setattr(etl, "LOCAL_OUTPUT_DIR", str(output_dir))
+
+    stats = etl.run_consolidation()
+
+    assert stats["orders_rows"] == 2
+    assert (output_dir / "orders.parquet").exists()
+
+def test_etl_rejects_unknown_backend(monkeypatch):
+    monkeypatch.setattr(etl, "CONSOLIDATION_BACKEND", "oracle")
+    with pytest.raises(ValueError):
+        etl.run_consolidation()
@@ -0,0 +1,157 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from streaming import consumer, envelope
+
+def make_event(order_id, amount=10):
+    return {"id": order_id, "status": "CREATED", "amount": amount,
+            "timestamp": "2025-10-01T12:00:00Z", "created_at": "2025-10-01T11:59:00Z"}
+
+class EnvelopeMessage:
+    def __init__(self, events, compression="zlib", extra_lines=b""):
+        self.data, self.attributes = envelope.encode_envelope(events, compression)
+        if extra_lines:
+            payload = envelope.decompress(self.data, compression) + extra_lines
+            self.data = envelope.compress(payload, compression)
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+@pytest.mark.parametrize("compression", ["zlib", "zstd"])
+def test_envelope_round_trip(compression):
+    events = [make_event(f"order{i}") for i in range(50)]
+    data, attributes = envelope.encode_envelope(events, compression)
+
+    assert attributes == {"envelope": compression, "event_count": "50"}
+    assert len(data) < len(json.dumps(events))
+    assert envelope.decode_envelope(data, attributes) == [(event, None) for event in events]
+
+def test_decode_envelope_isolates_bad_lines():
+    message = EnvelopeMessage([make_event("order1")], extra_lines=b"{not json\n")
+
+    decoded = envelope.decode_envelope(message.data, message.attributes)
+
+    assert decoded[0] == (make_event("order1"), None)
+    assert decoded[1][0] == "{not json"
+    assert decoded[1][1].startswith("Invalid JSON")
+
+def test_iter_envelopes_splits_by_count():
+    events = [make_event(f"order{i}") for i in range(25)]
+
+    envelopes = list(envelope.iter_envelopes(events, max_events=10))
+
+    assert [attributes["event_count"] for _, attributes in envelopes] == ["10", "10", "5"]
+
+def test_publish_events_publishes_with_attributes():
+    publisher = MagicMock()
+
+    futures = envelope.publish_events(publisher, "projects/p/topics/orders", [make_event("order1")], compression="zstd")
+
+    assert len(futures) == 1
+    topic, data = publisher.publish.call_args[0]
+    assert topic == "projects/p/topics/orders"
+    assert publisher.publish.call_args.kwargs == {"envelope": "zstd", "event_count": "1"}
+
+def test_callback_envelope_inserts_all_rows_once_and_acks(monkeypatch):
+    insert_rows = MagicMock(return_value=[])
+    monkeypatch.setattr(consumer, "insert_rows_batch", insert_rows)
+    message = EnvelopeMessage([make_event("order1"), make_event("order2")])
+
+    consumer.callback(message)
+
+    insert_rows.assert_called_once()
+    assert [row["order_id"] for row in insert_rows.call_args[0][0]] == ["order1", "order2"]
+    assert message.acked is True
+    assert message.nacked is False
+
+def test_callback_envelope_dead_letters_invalid_events(monkeypatch):
+    insert_rows = MagicMock(return_value=[])
+    publisher = MagicMock()
+    monkeypatch.setattr(consumer, "insert_rows_batch", insert_rows)
+    monkeypatch.setattr(consumer, "dlq_publisher", publisher)
+    monkeypatch.setattr(consumer, "dlq_topic_path", "projects/p/topics/orders-dlq")
+    message = EnvelopeMessage([make_event("order1"), make_event("negative", amount=-5)], extra_lines=b"{not json\n")
+
+    consumer.callback(message)
+
+    assert [row["order_id"] for row in insert_rows.call_args[0][0]] == ["order1"]
+    topic, data = publisher.publish.call_args[0]
+    dlq = envelope.decode_envelope(data, publisher.publish.call_args.kwargs)
+    assert topic == "projects/p/topics/orders-dlq"
+    assert [entry["event"] for entry, _ in dlq] == [make_event("negative", amount=-5), "{not json"]
+    publisher.publish.return_value.result.assert_called_once()
+    assert message.acked is True
+
+def test_callback_envelope_without_dlq_topic_nacks_whole_message(monkeypatch):
+    insert_rows = MagicMock(return_value=[])
+    monkeypatch.setattr(consumer, "insert_rows_batch", insert_rows)
+    monkeypatch.setattr(consumer, "dlq_publisher", None)
+    message = EnvelopeMessage([make_event("order1"), make_event("negative", amount=-5)])
+
+    consumer.callback(message)
+
+    insert_rows.assert_not_called()
+    assert message.acked is False
+    assert message.nacked is True
+
+def test_callback_envelope_acks_after_sink_acks_every_row(monkeypatch):
+    appended = []
+    sink = MagicMock()
+    sink.append.side_effect = lambda row, message: appended.append(message)
+    monkeypatch.setattr(consumer, "row_sink", sink)
+    message = EnvelopeMessage([make_event("order1"), make_event("order2")])
+
+    consumer.callback(message)
+
+    assert len(appended) == 2
+    appended[0].ack()
+    assert message.acked is False
+    appended[1].ack()
+    assert message.acked is True
+
+def test_callback_envelope_dead_letters_missing_id_before_appending_and_publishes_after_sink_acks(monkeypatch):
+    appended = []
+    sink = MagicMock()
+    sink.append.side_effect = lambda row, message: appended.append((row, message))
+    publisher = MagicMock()
+    monkeypatch.setattr(consumer, "row_sink", sink)
+    monkeypatch.setattr(consumer, "dlq_publisher", publisher)
+    monkeypatch.setattr(consumer, "dlq_topic_path", "projects/p/topics/orders-dlq")
+    missing_id = make_event("order2")
+    del missing_id["id"]
+    message = EnvelopeMessage([make_event("order1"), missing_id])
+
+    consumer.callback(message)
+
+    assert [row["order_id"] for row, _ in appended] == ["order1"]
+    publisher.publish.assert_not_called()
+    appended[0][1].ack()
+    dlq = envelope.decode_envelope(publisher.publish.call_args[0][1], publisher.publish.call_args.kwargs)
+    assert [(entry["event"], entry["error"]) for entry, _ in dlq] == [(missing_id, "missing order_id")]
+    assert message.acked is True
+
+def test_envelope_ack_nacks_when_before_ack_fails():
+    message = MagicMock()
+    envelope_ack = envelope.EnvelopeAck(message, 1, before_ack=MagicMock(side_effect=RuntimeError("publish failed")))
+
+    envelope_ack.ack()
+
+    message.nack.assert_called_once()
+    message.ack.assert_not_called()
+
+def test_envelope_ack_nacks_once_on_first_row_failure():
+    message = MagicMock()
+    envelope_ack = envelope.EnvelopeAck(message, 3)
+
+    envelope_ack.ack()
+    envelope_ack.nack()
+    envelope_ack.ack()
+    envelope_ack.ack()
+
+    message.nack.assert_called_once()
+    message.ack.assert_not_called()
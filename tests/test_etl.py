@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
 from aggregation import etl
+from bq import query as bq_query
 from unittest.mock import patch, MagicMock
 
 # Sample data simulating order_events
@@ -38,4 +39,74 @@ def test_run_consolidation(mock_client_cls, mock_getattr):
     with patch("aggregation.etl.logger") as mock_logger:
         etl.run_consolidation()
         mock_logger.info.assert_any_call("Starting consolidation query for valid events...")
-        mock_logger.info.assert_any_call("Consolidation finished successfully. Rows affected: 3")
\ No newline at end of file
+        mock_logger.info.assert_any_call("Consolidation finished successfully. Rows affected: 3")
+
+@patch("aggregation.etl.bigquery.Client")
+def test_run_consolidation_scans_order_events_once(mock_client_cls, monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_MAX_BYTES_PROCESSED", 0)
+    monkeypatch.setattr(bq_query.config, "QUERY_DRY_RUN", False)
+    mock_client = MagicMock()
+    mock_client_cls.return_value = mock_client
+
+    etl.run_consolidation()
+
+    # One script writes both tables from a single read of order_events
+    mock_client.query.assert_called_once()
+    script = mock_client.query.call_args[0][0]
+    assert script.count(f"`{etl.PROJECT_ID}.{etl.DATASET}.{etl.ORDER_EVENTS_TABLE}`") == 1
+    assert "PARSE_TIMESTAMP" not in script
+    assert f"CREATE OR REPLACE TABLE `{etl.PROJECT_ID}.{etl.DATASET}.{etl.DLQ_TABLE}`" in script
+    assert f"CREATE OR REPLACE TABLE `{etl.PROJECT_ID}.{etl.DATASET}.{etl.ORDERS_TABLE}`" in script
+
+@patch("aggregation.etl.bigquery.Client")
+def test_run_consolidation_with_budget_dry_runs_the_classify_scan(mock_client_cls, monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_MAX_BYTES_PROCESSED", 1_000_000)
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    mock_client = MagicMock()
+    mock_client.query.return_value.total_bytes_processed = 500
+    mock_client_cls.return_value = mock_client
+
+    etl.run_consolidation()
+
+    (dry_sql,), dry_kwargs = mock_client.query.call_args_list[0]
+    (script,), script_kwargs = mock_client.query.call_args_list[1]
+    assert dry_kwargs["job_config"].dry_run
+    assert dry_sql == etl.build_classify_select()
+    assert "CREATE TEMP TABLE" not in dry_sql
+    assert script == etl.build_consolidation_script()
+    assert script_kwargs["job_config"].maximum_bytes_billed == 1_000_000
+
+def test_compare_scan_bytes_dry_runs_both_plans():
+    mock_client = MagicMock()
+    mock_client.query.side_effect = [
+        MagicMock(total_bytes_processed=100),  # two-scan DLQ
+        MagicMock(total_bytes_processed=100),  # two-scan orders
+        MagicMock(total_bytes_processed=100),  # single scan
+    ]
+
+    result = etl.compare_scan_bytes(mock_client)
+
+    assert result == {"two_scan": {"estimated_bytes": 200}, "single_scan": {"estimated_bytes": 100}}
+    assert all(call.kwargs["job_config"].dry_run for call in mock_client.query.call_args_list)
+
+def test_compare_scan_bytes_executes_both_plans(monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    mock_client = MagicMock()
+
+    def query(sql, job_config=None):
+        if job_config.dry_run:
+            return MagicMock(total_bytes_processed=100)
+        return MagicMock(total_bytes_processed=100, slot_millis=40)
+
+    mock_client.query.side_effect = query
+
+    result = etl.compare_scan_bytes(mock_client, execute=True)
+
+    assert result["two_scan"]["bytes_processed"] == 200
+    assert result["two_scan"]["slot_millis"] == 80
+    assert result["single_scan"]["bytes_processed"] == 100
+    assert result["single_scan"]["slot_millis"] == 40
+    assert result["single_scan"]["duration_s"] >= 0
+    executed = [call for call in mock_client.query.call_args_list if not call.kwargs["job_config"].dry_run]
+    assert len(executed) == 3
+    assert all(call.kwargs["job_config"].use_query_cache is False for call in executed)
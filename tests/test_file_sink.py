@@ -0,0 +1,169 @@
+import os
+import pytest
+import pyarrow.parquet as pq
+from streaming import file_sink
+
+class DummyMessage:
+    def __init__(self):
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+def make_row(i):
+    return {"order_id": f"order{i}", "status": "CREATED", "amount": float(i),
+            "event_ts": "2025-10-01T12:00:00Z", "created_ts": "2025-10-01T11:59:00Z"}
+
+def test_segment_rolls_by_size_and_acks_after_write(tmp_path):
+    sink = file_sink.ParquetSegmentSink(str(tmp_path), max_rows=2)
+    messages = [DummyMessage() for _ in range(3)]
+
+    for i, message in enumerate(messages):
+        sink.append(make_row(i), message)
+
+    segments = [name for name in os.listdir(tmp_path) if name.endswith(".parquet")]
+    assert len(segments) == 1
+    assert [m.acked for m in messages] == [True, True, False]
+
+    table = pq.read_table(tmp_path / segments[0])
+    assert table.schema.equals(file_sink.ORDER_EVENTS_SCHEMA)
+    assert table.column("order_id").to_pylist() == ["order0", "order1"]
+
+    sink.close()
+    assert messages[2].acked is True
+
+def test_segment_write_failure_nacks(tmp_path, monkeypatch):
+    sink = file_sink.ParquetSegmentSink(str(tmp_path), max_rows=10)
+    message = DummyMessage()
+    sink.append(make_row(1), message)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(file_sink.pq, "write_table", fail)
+    assert sink.roll() is None
+    assert message.nacked is True
+    assert message.acked is False
+    assert os.listdir(tmp_path) == []
+
+def test_segment_rolls_by_age(tmp_path):
+    sink = file_sink.ParquetSegmentSink(str(tmp_path), max_rows=100, max_age_seconds=0.05)
+    sink.start()
+    message = DummyMessage()
+    sink.append(make_row(1), message)
+    sink._stop.wait(0.3)
+    assert message.acked is True
+    sink.close()
+
+def test_committer_moves_segments_to_local_target(tmp_path):
+    staging = tmp_path / "staging"
+    target = tmp_path / "target"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    sink.append(make_row(1), DummyMessage())
+    sink.append(make_row(2), DummyMessage())
+
+    committer = file_sink.SegmentCommitter(str(staging), file_sink.LocalDirectoryTarget(str(target)))
+    assert committer.commit() == 2
+    assert committer.pending_segments() == []
+    assert len(os.listdir(target)) == 2
+
+def test_invalid_row_rejected(tmp_path):
+    sink = file_sink.ParquetSegmentSink(str(tmp_path))
+    message = DummyMessage()
+    with pytest.raises(ValueError, match="Invalid amount"):
+        sink.append({"dlq_reason": "Invalid amount: cannot be negative"}, message)
+    assert message.acked is False
+
+def test_bigquery_target_loads_all_segments_with_one_job(tmp_path):
+    from unittest.mock import MagicMock
+    staging = tmp_path / "staging"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    for i in range(3):
+        sink.append(make_row(i), DummyMessage())
+    bq_client, storage_client = MagicMock(), MagicMock()
+    storage_client.bucket.return_value.name = "staging-bucket"
+    target = file_sink.BigQueryLoadTarget(bq_client, "p.analytics.order_events", storage_client, "gs://staging-bucket/order_events/")
+
+    committer = file_sink.SegmentCommitter(str(staging), target)
+    assert committer.commit() == 3
+
+    bq_client.load_table_from_uri.assert_called_once()
+    uris = bq_client.load_table_from_uri.call_args[0][0]
+    assert len(uris) == 3
+    assert all(uri.startswith("gs://staging-bucket/order_events/segment-") for uri in uris)
+    assert committer.pending_segments() == []
+
+def make_bigquery_target():
+    from unittest.mock import MagicMock
+    bq_client, storage_client = MagicMock(), MagicMock()
+    storage_client.bucket.return_value.name = "staging-bucket"
+    return bq_client, file_sink.BigQueryLoadTarget(bq_client, "p.analytics.order_events", storage_client, "gs://staging-bucket")
+
+def test_bigquery_target_reuses_existing_job_on_conflict(tmp_path):
+    from google.api_core.exceptions import Conflict
+    staging = tmp_path / "staging"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    sink.append(make_row(1), DummyMessage())
+    bq_client, target = make_bigquery_target()
+    bq_client.load_table_from_uri.side_effect = Conflict("job exists")
+    bq_client.get_job.return_value.error_result = None
+
+    assert file_sink.SegmentCommitter(str(staging), target).commit() == 1
+
+    bq_client.get_job.return_value.result.assert_called_once()
+    assert bq_client.load_table_from_uri.call_count == 1
+
+def test_failed_cleanup_does_not_load_segments_again(tmp_path):
+    staging = tmp_path / "staging"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    for i in range(3):
+        sink.append(make_row(i), DummyMessage())
+    bq_client, target = make_bigquery_target()
+    target.bucket.blob.return_value.delete.side_effect = [None, OSError("delete failed")] + [None] * 10
+    committer = file_sink.SegmentCommitter(str(staging), target)
+
+    with pytest.raises(OSError):
+        committer.commit()
+    # A segment staged before the retry goes into a new batch
+    sink.append(make_row(3), DummyMessage())
+    assert committer.commit() == 4
+
+    loaded = [call[0][0] for call in bq_client.load_table_from_uri.call_args_list]
+    assert [len(uris) for uris in loaded] == [3, 1]
+    assert committer.pending_segments() == []
+    assert os.listdir(staging) == []
+
+def test_retry_of_unfinished_load_reuses_its_job_id(tmp_path):
+    staging = tmp_path / "staging"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    sink.append(make_row(1), DummyMessage())
+    bq_client, target = make_bigquery_target()
+    bq_client.load_table_from_uri.return_value.result.side_effect = [RuntimeError("backend error")] * 5 + [None, None]
+    committer = file_sink.SegmentCommitter(str(staging), target)
+
+    with pytest.raises(RuntimeError):
+        committer.commit()
+    sink.append(make_row(2), DummyMessage())
+    assert committer.commit() == 2
+
+    job_ids = [call.kwargs["job_id"] for call in bq_client.load_table_from_uri.call_args_list]
+    first = job_ids[0]
+    assert job_ids[:5] == [first] + [f"{first}_r{attempt}" for attempt in range(1, 5)]
+    # The recorded batch is retried under the same ids before the new segment gets its own load
+    assert job_ids[5] == first
+    assert len(set(job_ids)) == 6
+
+def test_close_raises_when_segments_cannot_be_committed(tmp_path):
+    staging = tmp_path / "staging"
+    sink = file_sink.ParquetSegmentSink(str(staging), max_rows=1)
+    sink.append(make_row(1), DummyMessage())
+    bq_client, target = make_bigquery_target()
+    bq_client.load_table_from_uri.side_effect = RuntimeError("quota exceeded")
+
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        file_sink.SegmentCommitter(str(staging), target).close()
+    assert len(os.listdir(staging)) == 2
@@ -0,0 +1,69 @@
+import gzip
+import json
+import pytest
+from streaming import file_source
+
+def make_events(n):
+    events = []
+    for i in range(n):
+        events.append({"id": f"order{i}", "status": "CREATED", "amount": i,
+                       "timestamp": "2025-10-01T12:00:00Z", "created_at": "2025-10-01T11:59:00Z"})
+    # Invalid events go to the DLQ
+    events.append({"id": "negative", "status": "CREATED", "amount": -1, "timestamp": "2025-10-01T12:00:00Z"})
+    return events
+
+@pytest.fixture
+def events_path(tmp_path):
+    path = tmp_path / "events.jsonl"
+    lines = [json.dumps(e) for e in make_events(200)] + ["not json"]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_split_ranges_end_on_line_boundaries(events_path):
+    data = events_path.read_bytes()
+    ranges = file_source.split_ranges(str(events_path), chunk_bytes=1000)
+
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+        assert data[end - 1:end] == b"\n"
+
+def test_replay_file_in_worker_processes(events_path, tmp_path):
+    written = []
+    dlq_path = tmp_path / "dlq.jsonl"
+
+    progress = file_source.replay_file(str(events_path), written.extend, workers=2, chunk_bytes=1000, dlq_path=str(dlq_path))
+
+    assert progress.rows == 200
+    assert progress.dlq == 2
+    assert sorted(row["order_id"] for row in written) == sorted(f"order{i}" for i in range(200))
+    dlq = [json.loads(line) for line in dlq_path.read_text().splitlines()]
+    assert "Invalid amount: cannot be negative" in [entry["error"] for entry in dlq]
+    assert "not json" in [entry["event"] for entry in dlq]
+
+def test_replay_gzip_file(tmp_path):
+    path = tmp_path / "events.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        for event in make_events(50):
+            f.write(json.dumps(event) + "\n")
+    written = []
+
+    progress = file_source.replay_file(str(path), written.extend, workers=2)
+
+    assert progress.rows == 50
+    assert progress.dlq == 1
+    assert len(written) == 50
+
+def test_replay_fails_when_sink_drops_rows(events_path, monkeypatch):
+    from unittest.mock import MagicMock
+    from streaming import consumer
+    monkeypatch.setattr(consumer, "insert_rows_batch", MagicMock(side_effect=RuntimeError("insert failed")))
+    monkeypatch.setattr(consumer.config, "BQ_FLUSH_SIZE_INITIAL", 10)
+    sink, close = file_source.build_sink("batch")
+
+    with pytest.raises(RuntimeError, match="could not be written"):
+        file_source.replay_file(str(events_path), sink, workers=2, chunk_bytes=1000)
+    with pytest.raises(RuntimeError, match="could not be written"):
+        close()
@@ -0,0 +1,64 @@
+import json
+import os
+import pytest
+from activation import gclid_index
+
+@pytest.fixture
+def click_log(tmp_path):
+    path = tmp_path / "clicks.csv"
+    path.write_text(
+        "order_id,session_id,gclid\n"
+        "order1,sess1,GCLID_A\n"
+        "order2,,GCLID_B\n"
+        ",sess3,GCLID_C\n"
+        "order4,sess4,\n"
+    )
+    return path
+
+def test_build_and_lookup(click_log, tmp_path):
+    index_path = tmp_path / "gclid.idx"
+    assert gclid_index.build_index(str(click_log), str(index_path)) == 4
+
+    index = gclid_index.GclidIndex(str(index_path))
+    assert len(index) == 4
+    assert index.lookup(order_id="order1") == "GCLID_A"
+    assert index.lookup(order_id="order2") == "GCLID_B"
+    # Falls back to the session when the order has no click
+    assert index.lookup(order_id="order3", session_id="sess3") == "GCLID_C"
+    assert index.lookup(order_id="order4", session_id="sess4") is None
+
+def test_build_from_jsonl_with_many_keys(tmp_path):
+    export = tmp_path / "clicks.jsonl"
+    export.write_text("\n".join(json.dumps({"order_id": f"order{i}", "gclid": f"G{i}"}) for i in range(5000)))
+    index_path = tmp_path / "gclid.idx"
+    gclid_index.build_index(str(export), str(index_path))
+
+    index = gclid_index.GclidIndex(str(index_path))
+    assert all(index.lookup(order_id=f"order{i}") == f"G{i}" for i in range(5000))
+    assert index.lookup(order_id="missing") is None
+
+def test_reloading_index_picks_up_new_file(click_log, tmp_path):
+    index_path = tmp_path / "gclid.idx"
+    gclid_index.build_index(str(click_log), str(index_path))
+    index = gclid_index.ReloadingGclidIndex(str(index_path), reload_seconds=3600)
+    assert index.lookup(order_id="order9") is None
+
+    click_log.write_text("order_id,session_id,gclid\norder9,,GCLID_NEW\n")
+    gclid_index.build_index(str(click_log), str(index_path))
+    os.utime(index_path, ns=(0, os.stat(index_path).st_mtime_ns + 1))
+
+    assert index.reload_if_changed() is True
+    assert index.lookup(order_id="order9") == "GCLID_NEW"
+    index.close()
+
+def test_hash_collisions_keep_keys_apart(click_log, tmp_path, monkeypatch):
+    # Every key hashes to the same value, so only the stored key bytes tell entries apart
+    monkeypatch.setattr(gclid_index, "_key_hash", lambda key: 42)
+    index_path = tmp_path / "gclid.idx"
+    gclid_index.build_index(str(click_log), str(index_path))
+
+    index = gclid_index.GclidIndex(str(index_path))
+    assert index.lookup(order_id="order1") == "GCLID_A"
+    assert index.lookup(order_id="order2") == "GCLID_B"
+    assert index.lookup(session_id="sess3") == "GCLID_C"
+    assert index.lookup(order_id="order9") is None
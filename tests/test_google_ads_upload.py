@@ -93,3 +93,35 @@ def test_upload_conversion_negative_value(caplog):
     result = ga.upload_conversion(payload)
     assert result is False
     assert "Negative conversion value" in caplog.text
+
+@patch("activation.google_ads_upload.upload_conversion", return_value=True)
+def test_batch_upload_chunks_grow_with_healthy_uploads(mock_upload, monkeypatch, caplog):
+    from datetime import datetime, timezone
+    caplog.set_level("INFO")
+    monkeypatch.setattr(ga, "ADS_CHUNK_SIZE_INITIAL", 10)
+    monkeypatch.setattr(ga, "ADS_CHUNK_SIZE_MIN", 10)
+    orders = [
+        DummyOrder(f"order{i}", "COMPLETED", 10.0, datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc), gclid="GCLID")
+        for i in range(100)
+    ]
+
+    ga.batch_upload(orders)
+
+    assert mock_upload.call_count == 100
+    assert "[ads_chunk_size] increase 10 -> 20" in caplog.text
+    assert "Batch upload finished. Success: 100, Failures: 0, Skipped: 0" in caplog.text
+
+@patch("activation.google_ads_upload.upload_conversion", return_value=True)
+def test_batch_upload_enriches_gclid_from_index(mock_upload):
+    from datetime import datetime, timezone
+    index = MagicMock()
+    index.lookup.side_effect = lambda order_id=None, session_id=None: {"order1": "GCLID_FROM_INDEX"}.get(order_id)
+    orders = [
+        DummyOrder("order1", "COMPLETED", 10.0, datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc)),
+        DummyOrder("order2", "COMPLETED", 20.0, datetime(2025, 10, 1, 13, 0, tzinfo=timezone.utc)),
+    ]
+
+    ga.batch_upload(orders, gclid_index=index)
+
+    gclids = {call.args[0]["order_id"]: call.args[0]["gclid"] for call in mock_upload.call_args_list}
+    assert gclids == {"order1": "GCLID_FROM_INDEX", "order2": "TEST_GCLID"}
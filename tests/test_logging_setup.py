@@ -0,0 +1,48 @@
+import logging
+import queue
+from logging_setup import SamplingFilter, IntervalSummary, LazyQueueHandler
+
+def make_record(level, msg, args=()):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+def test_sampling_filter_keeps_one_in_n_info_records():
+    sampler = SamplingFilter(every=10)
+    kept = sum(sampler.filter(make_record(logging.INFO, "Inserted %s", (i,))) for i in range(100))
+    assert kept == 10
+
+def test_sampling_filter_never_drops_errors():
+    sampler = SamplingFilter(every=10)
+    assert all(sampler.filter(make_record(logging.ERROR, "Failed %s", (i,))) for i in range(100))
+    assert all(sampler.filter(make_record(logging.WARNING, "Skipping %s", (i,))) for i in range(100))
+
+def test_sampling_filter_bounds_counted_templates():
+    sampler = SamplingFilter(every=10, max_keys=100)
+    for i in range(1000):
+        sampler.filter(make_record(logging.INFO, f"Inserted {i}"))
+    assert len(sampler._counts) <= 100
+
+def test_lazy_queue_handler_defers_formatting():
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    record = make_record(logging.INFO, "Inserted %s", ("order1",))
+    handler.emit(record)
+    queued = log_queue.get_nowait()
+    assert queued.msg == "Inserted %s"
+    assert queued.args == ("order1",)
+    assert queued.getMessage() == "Inserted order1"
+
+def test_interval_summary_aggregates_events(caplog):
+    caplog.set_level("INFO")
+    summary = IntervalSummary(logging.getLogger("test_summary"), "Inserted events", interval_seconds=3600)
+    for _ in range(250):
+        summary.add()
+    assert "Inserted events" not in caplog.text
+
+    summary.flush()
+    assert "Inserted events: 250 in last" in caplog.text
+
+def test_interval_summary_logs_when_interval_elapsed(caplog):
+    caplog.set_level("INFO")
+    summary = IntervalSummary(logging.getLogger("test_summary"), "Uploaded conversions", interval_seconds=0)
+    summary.add(3)
+    assert "Uploaded conversions: 3 in last" in caplog.text
@@ -0,0 +1,192 @@
+import json
+import os
+from datetime import datetime, timezone, timedelta
+from unittest.mock import MagicMock
+import main
+from streaming import consumer
+from streaming.order_state import OrderStateStore, StateCheckpointer, TrackedMessage
+
+BASE_TS = datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+def make_row(order_id, status="CREATED", minutes=0, amount=10.0):
+    return {"order_id": order_id, "status": status, "amount": amount,
+            "event_ts": BASE_TS + timedelta(minutes=minutes), "created_ts": BASE_TS}
+
+def make_message(order_id, publish_time):
+    message = MagicMock(publish_time=publish_time, attributes={})
+    message.data = json.dumps({"id": order_id, "status": "COMPLETED", "amount": 10,
+                               "timestamp": "2025-10-01T12:00:00Z", "created_at": "2025-10-01T11:59:00Z"}).encode("utf-8")
+    return message
+
+def test_checkpoint_writes_base_then_deltas_and_restores(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+    store.apply(make_row("order1"))
+    store.apply(make_row("order2"))
+    assert store.checkpoint() == "base-000001.bin"
+
+    store.apply(make_row("order1", status="COMPLETED", minutes=5))
+    assert store.checkpoint() == "delta-000002.bin"
+    # Nothing changed since the last checkpoint
+    assert store.checkpoint() is None
+
+    restored = OrderStateStore(str(tmp_path))
+    restored.load()
+    assert len(restored) == 2
+    assert restored.get("order1") == make_row("order1", status="COMPLETED", minutes=5)
+    assert restored.get("order2") == make_row("order2")
+
+def test_apply_keeps_latest_event(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+
+    assert store.apply(make_row("order1", status="COMPLETED", minutes=5)) is True
+    assert store.apply(make_row("order1", status="CREATED", minutes=0)) is False
+
+    assert store.get("order1")["status"] == "COMPLETED"
+
+def test_delete_is_checkpointed_as_tombstone(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+    store.apply(make_row("order1"))
+    store.apply(make_row("order2"))
+    store.checkpoint()
+
+    assert store.delete("order1") is True
+    assert store.delete("missing") is False
+    assert store.checkpoint() == "delta-000002.bin"
+
+    restored = OrderStateStore(str(tmp_path))
+    restored.load()
+    assert list(restored) == ["order2"]
+
+def test_compaction_replaces_deltas_with_new_base(tmp_path):
+    store = OrderStateStore(str(tmp_path), max_deltas=2)
+    for minutes in range(4):
+        store.apply(make_row("order1", minutes=minutes))
+        store.checkpoint()
+
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["base"] == "base-000004.bin"
+    assert manifest["deltas"] == []
+    assert sorted(os.listdir(tmp_path)) == ["base-000004.bin", "manifest.json"]
+
+def test_position_stops_at_oldest_in_flight_message(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+    older, newer = BASE_TS, BASE_TS + timedelta(seconds=30)
+    store.begin(older)
+    store.begin(newer)
+    store.apply(make_row("order2"))
+    store.finish(newer)
+
+    store.checkpoint()
+    assert store.position == {"publish_time": older.isoformat()}
+
+    store.apply(make_row("order1"))
+    store.finish(older)
+    store.checkpoint()
+    assert store.position == {"publish_time": newer.isoformat()}
+
+def test_nacked_message_pins_position_until_redelivery_is_acked(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+    older, newer = BASE_TS, BASE_TS + timedelta(seconds=30)
+    message = MagicMock()
+    nacked = TrackedMessage(store, message, older)
+    nacked.rows.append(make_row("order1"))
+    TrackedMessage(store, MagicMock(), newer).ack()
+
+    nacked.nack()
+    store.checkpoint()
+    assert store.position == {"publish_time": older.isoformat()}
+    assert store.get("order1") is None
+
+    redelivered = TrackedMessage(store, message, older)
+    redelivered.rows.append(make_row("order1"))
+    redelivered.ack()
+    store.checkpoint()
+    assert store.position == {"publish_time": newer.isoformat()}
+    assert store.get("order1")["status"] == "CREATED"
+
+def test_checkpointer_checkpoints_on_close(tmp_path):
+    store = OrderStateStore(str(tmp_path))
+    checkpointer = StateCheckpointer(store, interval_seconds=3600)
+    checkpointer.start()
+    store.apply(make_row("order1"))
+
+    checkpointer.close()
+
+    assert (tmp_path / "manifest.json").exists()
+
+def test_consumer_restores_state_without_seeking(tmp_path, monkeypatch):
+    monkeypatch.setattr(consumer.config, "ORDER_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(consumer, "insert_into_bigquery", MagicMock())
+    message = make_message("order1", BASE_TS + timedelta(hours=1))
+
+    store, checkpointer = consumer.build_order_state()
+    monkeypatch.setattr(consumer, "order_state", store)
+    consumer.callback(message)
+    checkpointer.close()
+
+    restored, _ = consumer.build_order_state()
+    assert restored.get("order1")["status"] == "COMPLETED"
+
+def test_rebuild_applies_latest_order_events_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(consumer.config, "ORDER_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(consumer.config, "ORDER_STATE_REBUILD_ON_START", True)
+    store = OrderStateStore(str(tmp_path))
+    store.apply(make_row("order1"))
+    store.checkpoint()
+    client = MagicMock()
+    rows = [make_row("order1", status="COMPLETED", minutes=5), make_row("order2")]
+    client.query.return_value.result.return_value = [MagicMock(items=lambda row=row: row.items()) for row in rows]
+
+    restored, _ = consumer.build_order_state(client)
+
+    assert "QUALIFY ROW_NUMBER()" in client.query.call_args[0][0]
+    assert restored.get("order1")["status"] == "COMPLETED"
+    assert restored.get("order2") == make_row("order2")
+
+def test_consumer_applies_state_only_when_sink_acks(tmp_path, monkeypatch):
+    store = OrderStateStore(str(tmp_path))
+    appended = []
+    sink = MagicMock()
+    sink.append.side_effect = lambda row, message: appended.append(message)
+    monkeypatch.setattr(consumer, "order_state", store)
+    monkeypatch.setattr(consumer, "row_sink", sink)
+    older, newer = BASE_TS + timedelta(hours=1), BASE_TS + timedelta(hours=2)
+    first, second = make_message("order1", older), make_message("order2", newer)
+
+    consumer.callback(first)
+    consumer.callback(second)
+    appended[1].ack()
+    # order1 is still buffered in the sink: not applied, and the position cannot move past it
+    assert store.get("order1") is None
+    assert store.get("order2")["status"] == "COMPLETED"
+    store.checkpoint()
+    assert store.position == {"publish_time": older.isoformat()}
+
+    appended[0].ack()
+    first.ack.assert_called_once()
+    assert store.get("order1")["status"] == "COMPLETED"
+    store.checkpoint()
+    assert store.position == {"publish_time": newer.isoformat()}
+
+def test_warm_mock_run_uploads_only_changed_orders(tmp_path, monkeypatch):
+    events = [
+        {"id": "order1", "status": "COMPLETED", "amount": 10, "timestamp": "01/09/2025 13:00:00", "created_at": "01/09/2025 12:00:00"},
+        {"id": "order2", "status": "COMPLETED", "amount": 20, "timestamp": "01/09/2025 13:00:00", "created_at": "01/09/2025 12:00:00"},
+    ]
+    uploaded = []
+    monkeypatch.setattr(main, "upload_order", lambda order: uploaded.append(order["order_id"]) or (order["order_id"], True))
+    monkeypatch.setattr(main, "generate_mock_events", lambda num_events, fail_rate: events)
+    main.run_mock(num_events=2, state_dir=str(tmp_path))
+    assert uploaded == ["order1", "order2"]
+
+    # Second run: order1 is unchanged, order2 gets an invalid event
+    uploaded.clear()
+    events[:] = [events[0], {"id": "order2", "status": "COMPLETED", "amount": -1, "timestamp": "01/09/2025 14:00:00",
+                             "created_at": "01/09/2025 12:00:00"}]
+    main.run_mock(num_events=2, state_dir=str(tmp_path))
+    assert uploaded == []
+
+    restored = OrderStateStore(str(tmp_path))
+    restored.load()
+    assert list(restored) == ["order1"]
@@ -0,0 +1,91 @@
+import threading
+import pytest
+from pipeline import StagedPipeline, Stage
+
+def test_pipeline_runs_stages_in_order():
+    pipeline = StagedPipeline([
+        Stage("double", lambda x: x * 2),
+        Stage("drop_odd_inputs", lambda x: x if x % 4 == 0 else None),
+    ])
+    assert pipeline.run(range(6)) == [0, 4, 8]
+    report = {stats["stage"]: stats for stats in pipeline.report()}
+    assert report["double"]["items_in"] == 6
+    assert report["drop_odd_inputs"]["items_out"] == 3
+
+def test_pipeline_fan_out_and_on_finish_barrier():
+    seen = []
+
+    def collect(item):
+        seen.append(item)
+
+    pipeline = StagedPipeline([
+        Stage("split", lambda line: line.split(), fan_out=True, workers=2),
+        Stage("collect", collect, on_finish=lambda: [len(seen)]),
+    ])
+    assert pipeline.run(["a b", "c d e"]) == [5]
+    assert sorted(seen) == ["a", "b", "c", "d", "e"]
+
+def test_pipeline_bounded_queue_applies_backpressure():
+    release = threading.Event()
+    produced = []
+
+    def source():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    def slow(item):
+        release.wait()
+        return item
+
+    pipeline = StagedPipeline([Stage("slow", slow, queue_size=5)])
+    runner = threading.Thread(target=lambda: pipeline.run(source()))
+    runner.start()
+    release.wait(0.3)
+    # One item held by the worker, five queued, one blocked in put
+    assert len(produced) <= 7
+    release.set()
+    runner.join()
+    assert pipeline.report()[0]["items_in"] == 50
+    assert pipeline.report()[0]["queue_max"] <= 5
+
+def test_pipeline_propagates_stage_errors():
+    def fail(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    pipeline = StagedPipeline([Stage("fail", fail, workers=2), Stage("identity", lambda x: x)])
+    with pytest.raises(ValueError, match="bad item"):
+        pipeline.run(range(100))
+
+def test_pipeline_passes_results_to_callback_as_they_arrive():
+    received = []
+    pipeline = StagedPipeline([Stage("double", lambda x: x * 2, on_finish=lambda: [100])])
+
+    assert pipeline.run(range(3), on_result=received.append) == []
+    assert received == [0, 2, 4, 100]
+    assert pipeline.report()[0]["items_out"] == 4
+
+def test_run_mock_uploads_terminal_orders_before_end_of_input(monkeypatch):
+    import main
+    events = [
+        {"id": f"order{i}", "status": "COMPLETED", "amount": 10, "timestamp": "01/09/2025 13:00:00", "created_at": "01/09/2025 12:00:00"}
+        for i in range(3)
+    ]
+    uploaded = threading.Event()
+    transform = main.validate_and_transform
+
+    def slow_last_transform(event):
+        if event["id"] == "order2":
+            # The last event is held back until an earlier order has been uploaded
+            assert uploaded.wait(5)
+        return transform(event)
+
+    monkeypatch.setattr(main, "generate_mock_events", lambda num_events, fail_rate: events)
+    monkeypatch.setattr(main, "validate_and_transform", slow_last_transform)
+    monkeypatch.setattr(main, "upload_order", lambda order: uploaded.set() or (order["order_id"], True))
+
+    main.run_mock(num_events=3)
+
+    assert uploaded.is_set()
@@ -0,0 +1,77 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from bq import query as bq_query
+
+def make_client(estimated_bytes=100):
+    client = MagicMock()
+    dry_job = MagicMock(total_bytes_processed=estimated_bytes)
+    real_job = MagicMock(job_id="job_1", total_bytes_processed=estimated_bytes, total_bytes_billed=estimated_bytes,
+                         slot_millis=42, cache_hit=False)
+
+    def query(sql, job_config=None):
+        return dry_job if job_config is not None and job_config.dry_run else real_job
+
+    client.query.side_effect = query
+    return client, real_job
+
+def test_run_query_without_budget_skips_dry_run(monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_MAX_BYTES_PROCESSED", 0)
+    monkeypatch.setattr(bq_query.config, "QUERY_DRY_RUN", False)
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    client, real_job = make_client()
+
+    job = bq_query.run_query(client, "SELECT 1", label="plain")
+
+    assert job is real_job
+    client.query.assert_called_once_with("SELECT 1")
+    assert bq_query.QUERY_HISTORY[-1]["label"] == "plain"
+    assert bq_query.QUERY_HISTORY[-1]["slot_millis"] == 42
+
+def test_run_query_refuses_over_budget(monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    client, real_job = make_client(estimated_bytes=10_000)
+
+    with pytest.raises(bq_query.QueryBudgetExceeded):
+        bq_query.run_query(client, "SELECT * FROM big", label="too_big", max_bytes=1_000)
+
+    # Only the dry run was issued
+    assert client.query.call_count == 1
+    real_job.result.assert_not_called()
+    assert bq_query.QUERY_HISTORY[-1]["status"] == "REFUSED"
+
+def test_run_query_within_budget_records_history(monkeypatch, tmp_path):
+    history_path = tmp_path / "history.jsonl"
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", str(history_path))
+    client, real_job = make_client(estimated_bytes=500)
+
+    job = bq_query.run_query(client, "SELECT * FROM small", label="small", max_bytes=1_000)
+
+    assert job is real_job
+    assert client.query.call_count == 2
+    assert client.query.call_args.kwargs["job_config"].maximum_bytes_billed == 1_000
+    entry = json.loads(history_path.read_text().splitlines()[-1])
+    assert entry["label"] == "small"
+    assert entry["estimated_bytes"] == 500
+    assert entry["bytes_processed"] == 500
+
+def test_run_query_budget_leaves_caller_config_untouched(monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    client, real_job = make_client(estimated_bytes=500)
+    job_config = bq_query.bigquery.QueryJobConfig(use_query_cache=False)
+
+    bq_query.run_query(client, "SELECT * FROM small", job_config=job_config, label="small", max_bytes=1_000)
+
+    assert job_config.maximum_bytes_billed is None
+    assert client.query.call_args.kwargs["job_config"].maximum_bytes_billed == 1_000
+
+def test_run_query_dry_runs_estimate_query_for_scripts(monkeypatch):
+    monkeypatch.setattr(bq_query.config, "QUERY_HISTORY_PATH", "")
+    client, real_job = make_client(estimated_bytes=500)
+
+    bq_query.run_query(client, "CREATE TEMP TABLE t AS SELECT 1; SELECT * FROM t", label="script",
+                       max_bytes=1_000, estimate_query="SELECT 1")
+
+    dry_sql, real_sql = [call[0][0] for call in client.query.call_args_list]
+    assert dry_sql == "SELECT 1"
+    assert real_sql.startswith("CREATE TEMP TABLE")
@@ -0,0 +1,20 @@
+import pytest
+from benchmarks import startup
+
+@pytest.mark.parametrize("name,module", list(startup.ENTRY_POINTS.items()))
+def test_entry_points_do_not_import_heavy_sdks(name, module):
+    assert startup.loaded_heavy_modules(module) == []
+
+def test_find_regressions():
+    baseline = {"etl": 2.0, "consumer": 13.2, "activation": 20.0}
+    # etl doubles but stays within the few ms of slack, activation is under 1.5x,
+    # consumer is 2.8x its baseline
+    results = {"etl": 4.0, "consumer": 37.3, "activation": 25.0, "new_entry_point": 1000.0}
+    regressions = startup.find_regressions(results, baseline)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("consumer")
+
+def test_lazy_module_loads_on_attribute_access():
+    from lazy_import import lazy_import
+    lazy_json = lazy_import("json")
+    assert lazy_json.dumps({"a": 1}) == '{"a": 1}'
@@ -0,0 +1,104 @@
+import datetime
+import pytest
+from unittest.mock import MagicMock
+from streaming import write_api
+
+TABLE = "projects/p/datasets/analytics/tables/order_events"
+
+def make_rows(start, count):
+    return [{"order_id": f"order{i}", "status": "CREATED", "amount": float(i),
+             "event_ts": "2025-10-01T12:00:00Z", "created_ts": "2025-10-01T11:59:00Z"} for i in range(start, start + count)]
+
+def test_encode_record_batch_uses_typed_columns():
+    batch = write_api.encode_record_batch(make_rows(0, 2))
+    assert batch.num_rows == 2
+    assert str(batch.schema.field("event_ts").type) == "timestamp[us, tz=UTC]"
+    assert batch.column(3)[0].as_py() == datetime.datetime(2025, 10, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+def make_writer(server):
+    return write_api.CommittedStreamWriter(server, TABLE, open_stream=server.open_append_stream)
+
+def test_committed_stream_appends_with_offsets():
+    server = write_api.LocalWriteServer()
+    writer = make_writer(server)
+
+    assert writer.append(make_rows(0, 3)) == 0
+    assert writer.append(make_rows(3, 2)) == 3
+    # Committed rows are visible immediately
+    table = server.read_table(TABLE)
+    assert table.column("order_id").to_pylist() == [f"order{i}" for i in range(5)]
+
+    writer.close()
+    assert all(stream["finalized"] for stream in server.streams.values())
+
+def test_appends_share_one_stream_and_send_the_schema_once():
+    server = write_api.LocalWriteServer()
+    sent = []
+
+    def open_stream(template):
+        stream = server.open_append_stream(template)
+        send = stream.send
+        stream.send = lambda request: sent.append(request) or send(request)
+        return stream
+
+    opened = MagicMock(side_effect=open_stream)
+    writer = write_api.CommittedStreamWriter(server, TABLE, open_stream=opened)
+    writer.append(make_rows(0, 2))
+    writer.append(make_rows(2, 2))
+
+    opened.assert_called_once()
+    assert opened.call_args[0][0].write_stream == writer.stream_name
+    assert opened.call_args[0][0].arrow_rows.writer_schema.serialized_schema
+    assert [request.offset for request in sent] == [0, 2]
+    assert not sent[1].arrow_rows.writer_schema.serialized_schema
+    assert server.read_table(TABLE).num_rows == 4
+
+def test_retry_after_lost_response_does_not_duplicate_rows():
+    server = write_api.LocalWriteServer()
+
+    def open_stream(template):
+        stream = server.open_append_stream(template)
+        send = stream.send
+
+        def flaky_send(request):
+            future = send(request)
+            if stream.first_response_lost:
+                return future
+            stream.first_response_lost = True
+            raise ConnectionError("response lost")
+
+        stream.first_response_lost = False
+        stream.send = flaky_send
+        return stream
+
+    writer = write_api.CommittedStreamWriter(server, TABLE, open_stream=open_stream)
+
+    assert writer.append(make_rows(0, 2)) == 0
+    assert server.read_table(TABLE).num_rows == 2
+    assert writer.offset == 2
+
+def test_rejected_append_abandons_stream():
+    server = write_api.LocalWriteServer()
+    writer = make_writer(server)
+    writer.append(make_rows(0, 1))
+    # Simulate another writer advancing the stream behind our back
+    writer.offset = 5
+
+    with pytest.raises(RuntimeError):
+        writer.append(make_rows(1, 1))
+    assert writer.stream_name is None
+
+    writer.append(make_rows(1, 1))
+    assert len(server.streams) == 2
+    assert server.read_table(TABLE).num_rows == 2
+
+def test_insert_rows_reports_invalid_rows_and_appends_the_rest():
+    server = write_api.LocalWriteServer()
+    writer = make_writer(server)
+    rows = make_rows(0, 3)
+    rows[1] = {"dlq_reason": "Invalid amount: cannot be negative"}
+
+    errors = writer.insert_rows(rows)
+
+    assert [error["index"] for error in errors] == [1]
+    assert server.read_table(TABLE).column("order_id").to_pylist() == ["order0", "order2"]